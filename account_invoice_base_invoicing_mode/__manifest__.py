@@ -2,7 +2,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 {
     "name": "Account Invoice Base Invoicing Mode",
-    "version": "14.0.1.2.2",
+    "version": "14.0.1.3.0",
     "summary": "Base module for handling multiple invoicing mode",
     "author": "Camptocamp, Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/account-invoicing",
@@ -10,7 +10,9 @@
     "category": "Accounting & Finance",
     "depends": ["account", "queue_job", "sale"],
     "data": [
+        "security/ir.model.access.csv",
         "data/queue_job_data.xml",
+        "views/invoicing_mode_run.xml",
         "views/res_partner.xml",
     ],
 }
@@ -1,4 +1,5 @@
 from . import account_invoice
+from . import invoicing_mode_run
 from . import queue_job
 from . import res_partner
 from . import sale_order
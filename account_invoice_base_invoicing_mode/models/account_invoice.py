@@ -1,7 +1,15 @@
 # Copyright 2020 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
-from odoo import models
+import logging
+
+from psycopg2 import errors
+
+from odoo import _, models
+
+from odoo.addons.queue_job.exception import RetryableJobError
+
+_logger = logging.getLogger(__name__)
 
 
 class AccountMove(models.Model):
@@ -9,3 +17,85 @@ class AccountMove(models.Model):
 
     def _validate_invoice(self):
         return self.sudo().action_post()
+
+    def _get_validation_job_size(self):
+        """Maximum number of invoices validated by a job."""
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("account_invoice_base_invoicing_mode.validation_job_size", 100)
+        )
+
+    def _enqueue_validate_invoices(self):
+        """Enqueue the validation of the invoices, in batches of invoices of
+        the same company and journal.
+
+        :return: list of job.Job
+        """
+        job_size = max(self._get_validation_job_size(), 1)
+        batches = {}
+        for invoice in self.sorted("id"):
+            key = (invoice.company_id, invoice.journal_id)
+            batches.setdefault(key, self.browse())
+            batches[key] |= invoice
+        delayed_jobs = []
+        for (_company, journal), invoices in batches.items():
+            for start in range(0, len(invoices), job_size):
+                batch = invoices[start : start + job_size]
+                delayed_jobs.append(
+                    batch.with_delay(
+                        description=_("Validate %s invoices of journal %s")
+                        % (len(batch), journal.display_name)
+                    )._validate_invoices()
+                )
+        return delayed_jobs
+
+    def _lock_journal_sequence(self):
+        """Lock the journals of the invoices for the whole transaction, so
+        that batches posting in the same journal are run one after the other
+        instead of competing for each number of the sequence.
+        """
+        try:
+            # NO KEY UPDATE does not prevent the creation of new moves
+            self.env.cr.execute(
+                "SELECT id FROM account_journal WHERE id IN %s "
+                "FOR NO KEY UPDATE NOWAIT",
+                (tuple(self.journal_id.ids),),
+            )
+        except errors.LockNotAvailable as error:
+            # Waiting for another job is not a failure: retry without limit
+            raise RetryableJobError(
+                "The journal is locked by another validation job",
+                seconds=10,
+                ignore_retry=True,
+            ) from error
+
+    def _validate_invoices(self):
+        """Post the invoices in order, the journal sequence being locked once
+        for the batch. An invoice failing is rolled back and validated in its
+        own job.
+
+        :return: str
+        """
+        invoices = self.exists().filtered(lambda inv: inv.state == "draft").sudo()
+        if not invoices:
+            return _("No invoice to validate.")
+        invoices._lock_journal_sequence()
+        posted = self.browse()
+        for invoice in invoices.sorted(lambda inv: (inv.date, inv.id)):
+            invoice.flush()
+            try:
+                with self.env.cr.savepoint():
+                    invoice.action_post()
+                    invoice.flush()
+            except RetryableJobError:
+                raise
+            except Exception:
+                _logger.exception(
+                    "Failed to validate invoice %s, enqueued in a new job", invoice.id
+                )
+                invoice.invalidate_cache()
+                invoice.with_delay()._validate_invoice()
+                continue
+            posted |= invoice
+        return _("%s of %s invoices validated.") % (len(posted), len(invoices))
@@ -0,0 +1,277 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import threading
+
+from odoo import _, api, fields, models
+from odoo.tools import split_every
+
+from odoo.addons.queue_job.job import STATES
+
+# Number of groups of sale orders enqueued before committing the run
+ENQUEUE_COMMIT_SIZE = 100
+
+
+class InvoicingModeRun(models.Model):
+    _name = "invoicing.mode.run"
+    _description = "Invoicing Mode Run"
+    _order = "date_start desc, id desc"
+
+    name = fields.Char(required=True, readonly=True)
+    invoicing_mode = fields.Char(required=True, readonly=True, index=True)
+    company_ids = fields.Many2many(
+        comodel_name="res.company", string="Companies", readonly=True
+    )
+    state = fields.Selection(
+        selection=[("enqueuing", "Enqueuing"), ("enqueued", "Enqueued")],
+        default="enqueuing",
+        required=True,
+        readonly=True,
+        index=True,
+        help="A run still enqueuing is resumed by the next execution of the "
+        "invoicing cron.",
+    )
+    date_start = fields.Datetime(
+        string="Started on", default=fields.Datetime.now, readonly=True
+    )
+    date_enqueued = fields.Datetime(string="Enqueued on", readonly=True)
+    group_ids = fields.One2many(
+        comodel_name="invoicing.mode.run.group",
+        inverse_name="run_id",
+        string="Groups",
+        readonly=True,
+    )
+    group_count = fields.Integer(compute="_compute_statistics")
+    done_group_count = fields.Integer(compute="_compute_statistics")
+    failed_group_count = fields.Integer(compute="_compute_statistics")
+    order_count = fields.Integer(compute="_compute_statistics")
+    done_order_count = fields.Integer(compute="_compute_statistics")
+    invoice_count = fields.Integer(compute="_compute_statistics")
+    date_end = fields.Datetime(
+        string="Ended on",
+        compute="_compute_statistics",
+        help="End of the last group of sale orders invoiced, once all of " "them are.",
+    )
+    orders_per_minute = fields.Float(
+        compute="_compute_statistics",
+        help="Sale orders invoiced per minute since the start of the run.",
+    )
+
+    def _compute_statistics(self):
+        group_obj = self.env["invoicing.mode.run.group"]
+        counters = (
+            "group_count",
+            "done_group_count",
+            "failed_group_count",
+            "order_count",
+            "done_order_count",
+            "invoice_count",
+        )
+        statistics = {run_id: dict.fromkeys(counters, 0) for run_id in self.ids}
+        last_ends = {}
+        for data in group_obj.read_group(
+            [("run_id", "in", self.ids)],
+            [
+                "run_id",
+                "state",
+                "order_count:sum",
+                "invoice_count:sum",
+                "date_end:max",
+            ],
+            ["run_id", "state"],
+            lazy=False,
+        ):
+            values = statistics[data["run_id"][0]]
+            values["group_count"] += data["__count"]
+            values["order_count"] += data["order_count"]
+            if data["state"] == "done":
+                values["done_group_count"] += data["__count"]
+                values["done_order_count"] += data["order_count"]
+                values["invoice_count"] += data["invoice_count"]
+                last_ends[data["run_id"][0]] = data["date_end"]
+        # Jobs are only readable by the job queue managers
+        for data in group_obj.sudo().read_group(
+            [("run_id", "in", self.ids), ("job_id.state", "=", "failed")],
+            ["run_id"],
+            ["run_id"],
+        ):
+            statistics[data["run_id"][0]]["failed_group_count"] = data["run_id_count"]
+        for run in self:
+            values = statistics.get(run.id, dict.fromkeys(counters, 0))
+            run.update(values)
+            # The run ends with the last group, once all of them are invoiced
+            if values["group_count"] == values["done_group_count"]:
+                run.date_end = last_ends.get(run.id, False)
+            else:
+                run.date_end = False
+            minutes = 0.0
+            if run.date_start:
+                date_end = run.date_end or fields.Datetime.now()
+                minutes = (date_end - run.date_start).total_seconds() / 60
+            run.orders_per_minute = (
+                values["done_order_count"] / minutes if minutes > 0 else 0.0
+            )
+
+    @api.model
+    def _get_resumable_run(self, companies, invoicing_mode):
+        """Get the run of the invoicing mode interrupted while enqueuing its
+        jobs for these companies.
+
+        :param companies: res.company recordset
+        :param invoicing_mode: str
+        :return: invoicing.mode.run recordset
+        """
+        runs = self.search(
+            [
+                ("invoicing_mode", "=", invoicing_mode),
+                ("state", "=", "enqueuing"),
+                ("company_ids", "in", companies.ids),
+            ]
+        )
+        return fields.first(runs.filtered(lambda r: r.company_ids == companies))
+
+    @api.model
+    def _create_run(self, companies, invoicing_mode, groupby):
+        """Create the run of the invoicing mode with one group of sale orders
+        to invoice by job.
+
+        :param companies: res.company recordset
+        :param invoicing_mode: str
+        :param groupby: list of sale order field names
+        :return: invoicing.mode.run recordset
+        """
+        saleorder_groups = self.env["sale.order"]._get_invoicing_mode_groups(
+            companies, invoicing_mode, groupby
+        )
+        return self.create(
+            {
+                "name": _("%s invoicing of %s")
+                % (invoicing_mode, fields.Datetime.to_string(fields.Datetime.now())),
+                "invoicing_mode": invoicing_mode,
+                "company_ids": [(6, 0, companies.ids)],
+                "group_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "partner_invoice_id": (
+                                group.get("partner_invoice_id") or [False]
+                            )[0],
+                            "sale_order_ids": [(6, 0, sorted(group["saleorder_ids"]))],
+                            "order_count": len(group["saleorder_ids"]),
+                        },
+                    )
+                    for group in saleorder_groups
+                ],
+            }
+        )
+
+    def _commit(self):
+        """Commit the progress of the run, so it can be resumed."""
+        if not getattr(threading.current_thread(), "testing", False):
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    def _enqueue_groups(self):
+        """Enqueue the jobs invoicing the pending groups of sale orders of
+        the run, committing regularly. All the groups are enqueued once done.
+        """
+        self.ensure_one()
+        sale_obj = self.env["sale.order"]
+        group_obj = self.env["invoicing.mode.run.group"]
+        pending_groups = self.group_ids.filtered(lambda g: g.state == "pending")
+        for group_ids in split_every(ENQUEUE_COMMIT_SIZE, pending_groups.ids):
+            groups = group_obj.browse(group_ids)
+            packs = sale_obj._pack_invoicing_groups(
+                [group.sale_order_ids.ids for group in groups]
+            )
+            groups_iter = iter(groups)
+            job_groups = {}
+            for pack in packs:
+                pack_groups = group_obj.browse([next(groups_iter).id for _i in pack])
+                if len(pack) == 1:
+                    delayed = sale_obj.with_delay()._generate_invoices_by_partner(
+                        pack[0], run_group_id=pack_groups.id
+                    )
+                else:
+                    delayed = sale_obj.with_delay()._generate_invoices_by_partners(
+                        pack, run_group_ids=pack_groups.ids
+                    )
+                job_groups[delayed.uuid] = pack_groups
+            groups.filtered(lambda g: g.state == "pending").write({"state": "enqueued"})
+            group_obj._link_jobs(job_groups)
+            self._commit()
+        self.write({"state": "enqueued", "date_enqueued": fields.Datetime.now()})
+
+
+class InvoicingModeRunGroup(models.Model):
+    _name = "invoicing.mode.run.group"
+    _description = "Invoicing Mode Run Group"
+    _order = "run_id, id"
+
+    run_id = fields.Many2one(
+        comodel_name="invoicing.mode.run",
+        string="Run",
+        required=True,
+        ondelete="cascade",
+        index=True,
+    )
+    partner_invoice_id = fields.Many2one(
+        comodel_name="res.partner", string="Invoice Address"
+    )
+    sale_order_ids = fields.Many2many(
+        comodel_name="sale.order",
+        relation="invoicing_mode_run_group_sale_order_rel",
+        column1="group_id",
+        column2="order_id",
+        string="Sale Orders",
+    )
+    state = fields.Selection(
+        selection=[
+            ("pending", "Pending"),
+            ("enqueued", "Enqueued"),
+            ("done", "Done"),
+        ],
+        default="pending",
+        required=True,
+        index=True,
+    )
+    job_id = fields.Many2one(comodel_name="queue.job", string="Job")
+    job_state = fields.Selection(
+        selection=STATES, string="Job State", compute="_compute_job_state"
+    )
+    order_count = fields.Integer(string="Sale Orders Count")
+    invoice_count = fields.Integer(string="Invoices Count")
+    date_start = fields.Datetime(string="Started on")
+    date_end = fields.Datetime(string="Ended on")
+
+    @api.depends("job_id.state")
+    def _compute_job_state(self):
+        for group in self:
+            # Jobs are only readable by the job queue managers
+            group.job_state = group.sudo().job_id.state
+
+    @api.model
+    def _link_jobs(self, job_groups):
+        """Link the groups to the jobs invoicing them.
+
+        :param job_groups: dict of job uuid: invoicing.mode.run.group recordset
+        """
+        jobs = self.env["queue.job"].sudo().search([("uuid", "in", list(job_groups))])
+        for job in jobs:
+            job_groups[job.uuid].sudo().write({"job_id": job.id})
+
+    def _set_done(self, date_start, invoices):
+        """Record the end of the invoicing of the group by its job.
+
+        :param date_start: datetime
+        :param invoices: account.move recordset or message
+        """
+        self.sudo().write(
+            {
+                "state": "done",
+                "date_start": date_start,
+                "date_end": fields.Datetime.now(),
+                "invoice_count": (
+                    len(invoices) if isinstance(invoices, models.BaseModel) else 0
+                ),
+            }
+        )
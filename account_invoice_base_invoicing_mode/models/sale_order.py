@@ -1,10 +1,13 @@
 # Copyright 2020 Camptocamp SA
 # Copyright 2023 Michael Tietz (MT Software) <mtietz@mt-software.de>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+import logging
 from datetime import datetime
 
 from odoo import api, fields, models
 
+_logger = logging.getLogger(__name__)
+
 
 class SaleOrder(models.Model):
     _inherit = "sale.order"
@@ -12,8 +15,12 @@ class SaleOrder(models.Model):
     invoicing_mode = fields.Selection(related="partner_invoice_id.invoicing_mode")
 
     @api.model
-    def _generate_invoices_by_partner(self, saleorder_ids):
-        """Generate invoices for a group of sale order belonging to a customer."""
+    def _create_invoices_by_partner(self, saleorder_ids):
+        """Create the invoices of a group of sale order belonging to a customer.
+
+        :param saleorder_ids: list of sale order ids
+        :return: account.move recordset or a message if nothing to invoice
+        """
         sales = (
             self.browse(saleorder_ids)
             .exists()
@@ -22,14 +29,100 @@ class SaleOrder(models.Model):
         if not sales:
             return "No sale order found to invoice ?"
         sales.partner_invoice_id.ensure_one()
-        invoices = sales._create_invoices(
+        return sales._create_invoices(
             grouped=sales.partner_invoice_id.one_invoice_per_order,
             final=True,
         )
-        for invoice in invoices:
-            invoice.with_delay()._validate_invoice()
+
+    @api.model
+    def _generate_invoices_by_partner(self, saleorder_ids, run_group_id=False):
+        """Generate invoices for a group of sale order belonging to a customer.
+
+        :param saleorder_ids: list of sale order ids
+        :param run_group_id: id of the invoicing.mode.run.group of the orders
+        """
+        date_start = fields.Datetime.now()
+        invoices = self._create_invoices_by_partner(saleorder_ids)
+        if isinstance(invoices, models.BaseModel):
+            invoices._enqueue_validate_invoices()
+        if run_group_id:
+            run_group = self.env["invoicing.mode.run.group"].browse(run_group_id)
+            run_group._set_done(date_start, invoices)
+        return invoices
+
+    @api.model
+    def _generate_invoices_by_partners(self, saleorder_ids_list, run_group_ids=None):
+        """Generate invoices for several groups of sale orders.
+
+        Each group is invoiced in its own savepoint: a group failing is
+        rolled back and enqueued in its own job, without affecting the others.
+
+        :param saleorder_ids_list: list of list of sale order ids
+        :param run_group_ids: ids of the invoicing.mode.run.group of each group
+        """
+        run_groups = self.env["invoicing.mode.run.group"].browse(run_group_ids or [])
+        invoices = self.env["account.move"]
+        for index, saleorder_ids in enumerate(saleorder_ids_list):
+            run_group = run_groups[index] if run_groups else run_groups
+            date_start = fields.Datetime.now()
+            self.flush()
+            try:
+                with self.env.cr.savepoint():
+                    result = self._create_invoices_by_partner(saleorder_ids)
+            except Exception:
+                _logger.exception(
+                    "Failed to invoice sale orders %s, enqueued in a new job",
+                    saleorder_ids,
+                )
+                self.invalidate_cache()
+                delayed = self.with_delay()._generate_invoices_by_partner(
+                    saleorder_ids, run_group_id=run_group.id
+                )
+                if run_group:
+                    run_groups._link_jobs({delayed.uuid: run_group})
+                continue
+            if isinstance(result, models.BaseModel):
+                invoices |= result
+            run_group._set_done(date_start, result)
+        # The invoices of all the groups are validated in the same batches
+        invoices._enqueue_validate_invoices()
         return invoices
 
+    @api.model
+    def _get_invoicing_mode_job_size(self):
+        """Target number of sale orders invoiced by a job.
+
+        Groups of sale orders are packed in the same job until this number is
+        reached. With 0, each group is invoiced by its own job.
+        """
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("account_invoice_base_invoicing_mode.job_size", 0)
+        )
+
+    @api.model
+    def _pack_invoicing_groups(self, saleorder_ids_list):
+        """Pack the groups of sale orders into the groups invoiced by each job.
+
+        :param saleorder_ids_list: list of list of sale order ids
+        :return: list of list of list of sale order ids
+        """
+        job_size = self._get_invoicing_mode_job_size()
+        packs = []
+        pack = []
+        size = 0
+        for saleorder_ids in saleorder_ids_list:
+            if pack and size + len(saleorder_ids) > job_size:
+                packs.append(pack)
+                pack = []
+                size = 0
+            pack.append(saleorder_ids)
+            size += len(saleorder_ids)
+        if pack:
+            packs.append(pack)
+        return packs
+
     @api.model
     def generate_invoices_by_invoice_mode(
         self,
@@ -41,34 +134,66 @@ class SaleOrder(models.Model):
         """Generate weekly invoices for customers who require that mode.
 
         Invoices will be generated by other jobs split for different customer
-        and different payment term.
+        and different payment term. The run and its groups of sale orders are
+        recorded, to resume the run if it is interrupted while enqueuing jobs.
+
+        :return: invoicing.mode.run recordset
         """
         if not invoice_mode:
             return self.env[self._name]
         if not companies:
             companies = self.company_id
-        saleorder_groups = self.read_group(
+        run_obj = self.env["invoicing.mode.run"]
+        # Resume the run interrupted while enqueuing its jobs, if any
+        run = run_obj._get_resumable_run(companies, invoice_mode)
+        if not run:
+            run = run_obj._create_run(companies, invoice_mode, groupby)
+            run._commit()
+        run._enqueue_groups()
+        companies.write({last_execution_field_name: datetime.now()})
+        return run
+
+    @api.model
+    def _get_invoicing_mode_groups(self, companies, invoice_mode, groupby):
+        """Get the groups of sale orders to invoice, each one by its own job.
+
+        :param companies: res.company recordset
+        :param invoice_mode: str
+        :param groupby: list of sale order field names
+        :return: list of dict, read_group results with the "saleorder_ids"
+        """
+        # The ids of the sale orders of each group are read in the same query
+        return self.read_group(
             [
                 ("invoicing_mode", "=", invoice_mode),
                 ("invoice_status", "=", "to invoice"),
                 ("company_id", "in", companies.ids),
             ],
-            ["partner_invoice_id"],
+            ["partner_invoice_id", "saleorder_ids:array_agg(id)"],
             groupby=groupby,
             lazy=False,
         )
-        for saleorder_group in saleorder_groups:
-            saleorder_ids = self.search(saleorder_group["__domain"]).ids
-            self.with_delay()._generate_invoices_by_partner(saleorder_ids)
-        companies.write({last_execution_field_name: datetime.now()})
-        return saleorder_groups
 
     def _create_invoices(self, grouped=False, final=False, date=None):
+        """Invoice the orders grouped or not according to their partner.
+
+        As the core already groups the invoices by partner, the orders of all
+        the partners invoiced one invoice per order are invoiced in one call,
+        and the orders of all the other partners in another one.
+        """
         moves = self.env["account.move"]
-        for partner_invoice in self.partner_invoice_id:
-            sales = self.filtered(lambda r: r.partner_invoice_id == partner_invoice)
-            moves += super(SaleOrder, sales)._create_invoices(
-                grouped=partner_invoice.one_invoice_per_order,
+        one_invoice_per_order_partner_ids = set(
+            self.partner_invoice_id.filtered("one_invoice_per_order").ids
+        )
+        sale_ids_by_order = {False: [], True: []}
+        for sale in self:
+            by_order = sale.partner_invoice_id.id in one_invoice_per_order_partner_ids
+            sale_ids_by_order[by_order].append(sale.id)
+        for by_order, sale_ids in sale_ids_by_order.items():
+            if not sale_ids:
+                continue
+            moves += super(SaleOrder, self.browse(sale_ids))._create_invoices(
+                grouped=by_order,
                 final=final,
                 date=date,
             )
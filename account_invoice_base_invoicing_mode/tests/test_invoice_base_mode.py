@@ -1,9 +1,13 @@
 # Copyright 2021 Camptocamp SA
 # Copyright 2023 Michael Tietz (MT Software) <mtietz@mt-software.de>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+from unittest import mock
+
 from odoo import tools
 from odoo.tests import tagged
 
+from odoo.addons.queue_job.exception import RetryableJobError
+
 from .common import TestInvoiceModeCommon
 
 
@@ -57,3 +61,187 @@ class TestInvoiceModeBase(TestInvoiceModeCommon):
                 last_execution_field_name="write_date",
             )
         self.assertEqual(len(self.so1.invoice_ids), 1)
+
+    def test_pack_invoicing_groups(self):
+        self.assertEqual(
+            self.SaleOrder._pack_invoicing_groups([[1], [2, 3], [4]]),
+            [[[1]], [[2, 3]], [[4]]],
+        )
+        self.env["ir.config_parameter"].sudo().set_param(
+            "account_invoice_base_invoicing_mode.job_size", 3
+        )
+        self.assertEqual(
+            self.SaleOrder._pack_invoicing_groups([[1], [2, 3], [4], [5, 6, 7, 8]]),
+            [[[1], [2, 3]], [[4]], [[5, 6, 7, 8]]],
+        )
+
+    def test_generate_invoices_packed_in_one_job(self):
+        self.so1.partner_invoice_id = self.partner2
+        self.deliver_invoice(self.so1)
+        self.deliver_invoice(self.so2)
+        self.env["ir.config_parameter"].sudo().set_param(
+            "account_invoice_base_invoicing_mode.job_size", 10
+        )
+        jobs_before = self.env["queue.job"].search([])
+        self.SaleOrder.generate_invoices_by_invoice_mode(
+            self.company, "standard", ["partner_invoice_id"], "write_date"
+        )
+        job = self.env["queue.job"].search([]) - jobs_before
+        self.assertEqual(len(job), 1)
+        self.assertEqual(job.method_name, "_generate_invoices_by_partners")
+        self.assertEqual(sorted(job.args[0]), sorted([self.so1.ids, self.so2.ids]))
+
+    def test_generate_invoices_by_partners_failure(self):
+        self.deliver_invoice(self.so1)
+        self.deliver_invoice(self.so2)
+        create = type(self.SaleOrder)._create_invoices_by_partner
+        so2_ids = self.so2.ids
+
+        def _create_invoices_by_partner(sale_orders, saleorder_ids):
+            if saleorder_ids == so2_ids:
+                raise ValueError("Invoicing failure")
+            return create(sale_orders, saleorder_ids)
+
+        jobs_before = self.env["queue.job"].search([])
+        with mock.patch.object(
+            type(self.SaleOrder),
+            "_create_invoices_by_partner",
+            _create_invoices_by_partner,
+        ), tools.mute_logger("odoo.addons.account_invoice_base_invoicing_mode"):
+            invoices = self.SaleOrder._generate_invoices_by_partners(
+                [self.so1.ids, so2_ids]
+            )
+        self.assertEqual(invoices, self.so1.invoice_ids)
+        self.assertFalse(self.so2.invoice_ids)
+        jobs = self.env["queue.job"].search([]) - jobs_before
+        self.assertEqual(
+            sorted(jobs.mapped("method_name")),
+            ["_generate_invoices_by_partner", "_validate_invoices"],
+        )
+        job = jobs.filtered(lambda j: j.method_name == "_generate_invoices_by_partner")
+        self.assertEqual(job.args, [so2_ids])
+
+    def test_validate_invoices_batches(self):
+        self.so1.partner_invoice_id = self.partner2
+        self.deliver_invoice(self.so1)
+        self.deliver_invoice(self.so2)
+        invoices = self.SaleOrder._create_invoices_by_partner(
+            self.so1.ids
+        ) | self.SaleOrder._create_invoices_by_partner(self.so2.ids)
+        self.assertEqual(len(invoices), 2)
+        self.env["ir.config_parameter"].sudo().set_param(
+            "account_invoice_base_invoicing_mode.validation_job_size", 1
+        )
+        self.assertEqual(len(invoices._enqueue_validate_invoices()), 2)
+        self.env["ir.config_parameter"].sudo().set_param(
+            "account_invoice_base_invoicing_mode.validation_job_size", 10
+        )
+        delayed_jobs = invoices._enqueue_validate_invoices()
+        self.assertEqual(len(delayed_jobs), 1)
+        self.assertEqual(delayed_jobs[0].recordset, invoices)
+        result = invoices._validate_invoices()
+        self.assertEqual(set(invoices.mapped("state")), {"posted"})
+        self.assertEqual(result, "2 of 2 invoices validated.")
+        self.assertEqual(invoices._validate_invoices(), "No invoice to validate.")
+
+    def test_validate_invoices_journal_locked(self):
+        self.deliver_invoice(self.so1)
+        invoice = self.SaleOrder._create_invoices_by_partner(self.so1.ids)
+        invoice.flush()
+        with self.registry.cursor() as cr:
+            # Another validation job holds the lock of the journal
+            cr.execute(
+                "SELECT id FROM account_journal WHERE id = %s "
+                "FOR NO KEY UPDATE NOWAIT",
+                (invoice.journal_id.id,),
+            )
+            with self.assertRaises(RetryableJobError) as error:
+                with self.env.cr.savepoint():
+                    invoice._validate_invoices()
+        self.assertTrue(error.exception.ignore_retry)
+        self.assertEqual(invoice.state, "draft")
+
+    def test_invoicing_mode_run(self):
+        self.so1.partner_invoice_id = self.partner2
+        self.deliver_invoice(self.so1)
+        self.deliver_invoice(self.so2)
+        with tools.mute_logger("odoo.addons.queue_job.models.base"):
+            run = self.SaleOrder.with_context(
+                test_queue_job_no_delay=True
+            ).generate_invoices_by_invoice_mode(
+                self.company, "standard", ["partner_invoice_id"], "write_date"
+            )
+        self.assertEqual(run.state, "enqueued")
+        self.assertEqual(run.company_ids, self.company)
+        self.assertEqual(run.group_count, 2)
+        self.assertEqual(run.done_group_count, 2)
+        self.assertEqual(run.order_count, 2)
+        self.assertEqual(run.invoice_count, 2)
+        self.assertTrue(run.date_end)
+        self.assertEqual(
+            run.group_ids.mapped("partner_invoice_id"), self.partner | self.partner2
+        )
+
+    def test_invoicing_mode_run_account_user(self):
+        self.deliver_invoice(self.so1)
+        with tools.mute_logger("odoo.addons.queue_job.models.base"):
+            run = self.SaleOrder.generate_invoices_by_invoice_mode(
+                self.company, "standard", ["partner_invoice_id"], "write_date"
+            )
+        run.group_ids.job_id.write({"state": "failed"})
+        user = self.env["res.users"].create(
+            {
+                "name": "Invoicing user",
+                "login": "invoicing_mode_run_user",
+                "company_id": self.company.id,
+                "company_ids": [(6, 0, self.company.ids)],
+                "groups_id": [
+                    (6, 0, self.env.ref("account.group_account_invoice").ids)
+                ],
+            }
+        )
+        self.assertFalse(user.has_group("queue_job.group_queue_job_manager"))
+        # An invoicing user without access to jobs can read the runs
+        run = run.with_user(user)
+        run.invalidate_cache()
+        self.assertEqual(run.failed_group_count, 1)
+        self.assertEqual(run.group_ids.mapped("job_state"), ["failed"])
+
+    def test_invoicing_mode_run_resume(self):
+        self.so1.partner_invoice_id = self.partner2
+        self.deliver_invoice(self.so1)
+        self.deliver_invoice(self.so2)
+        run_obj = self.env["invoicing.mode.run"]
+        run = run_obj._create_run(self.company, "standard", ["partner_invoice_id"])
+        # The run was interrupted after enqueuing the first group
+        run.group_ids[0].state = "enqueued"
+        self.assertEqual(run_obj._get_resumable_run(self.company, "standard"), run)
+        jobs_before = self.env["queue.job"].search([])
+        result = self.SaleOrder.generate_invoices_by_invoice_mode(
+            self.company, "standard", ["partner_invoice_id"], "write_date"
+        )
+        self.assertEqual(result, run)
+        self.assertEqual(run.state, "enqueued")
+        self.assertFalse(run_obj._get_resumable_run(self.company, "standard"))
+        job = self.env["queue.job"].search([]) - jobs_before
+        self.assertEqual(job.args, [run.group_ids[1].sale_order_ids.ids])
+        self.assertEqual(run.group_ids[1].job_id, job)
+
+    def test_create_invoices_one_invoice_per_order(self):
+        self.partner2.one_invoice_per_order = True
+        so3 = self.so1.copy()
+        so4 = self.so2.copy(
+            {"partner_invoice_id": self.partner2.id, "partner_id": self.partner2.id}
+        )
+        so5 = so4.copy()
+        sales = self.so1 | self.so2 | so3 | so4 | so5
+        for sale in sales:
+            self.deliver_invoice(sale)
+        invoices = sales._create_invoices(final=True)
+        # One invoice for the 3 orders of the first partner, one by order of
+        # the second one
+        self.assertEqual(len(invoices), 3)
+        self.assertEqual(len((self.so1 | self.so2 | so3).invoice_ids), 1)
+        self.assertEqual(len(so4.invoice_ids), 1)
+        self.assertEqual(len(so5.invoice_ids), 1)
+        self.assertNotEqual(so4.invoice_ids, so5.invoice_ids)
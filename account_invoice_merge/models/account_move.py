@@ -6,8 +6,11 @@
 # Copyright 2019 Okia SPRL
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
 
-from odoo import api, models
-from odoo.tools import float_is_zero
+from psycopg2 import sql
+
+from odoo import _, api, models
+from odoo.exceptions import UserError
+from odoo.tools import float_compare, float_is_zero
 
 
 class AccountMove(models.Model):
@@ -75,9 +78,43 @@ class AccountMove(models.Model):
         """Overridable function to return draft invoices to merge"""
         return self.filtered(lambda x: x.state == "draft")
 
-    # flake8: noqa: C901 (is too complex)
+    @api.model
+    def _read_merge_values(self, records, fields):
+        """
+        Read in a single call the values of the given fields used to merge
+        the records (relational fields are read as ids)
+        :param records: recordset
+        :param fields: list of field names
+        :return: list of dict
+        """
+        if not records:
+            return []
+        return records.read(fields, load="_classic_write")
+
+    @api.model
+    def _get_merge_key(self, values, fields, field_types):
+        """
+        Build the merge key of a record from its values read in bulk
+        :param values: dict of values (see _read_merge_values)
+        :param fields: list of field names
+        :param field_types: dict of field types by field name
+        :return: tuple
+        """
+        list_key = []
+        for field in fields:
+            field_val = values[field]
+            if field_types[field] in ("one2many", "many2many"):
+                field_val = tuple([(6, 0, tuple(field_val))])
+            list_key.append((field, field_val))
+        list_key.sort()
+        return tuple(list_key)
+
     def do_merge(
-        self, keep_references=True, date_invoice=False, remove_empty_invoice_lines=True
+        self,
+        keep_references=True,
+        date_invoice=False,
+        remove_empty_invoice_lines=True,
+        merge_in_place=False,
     ):
         """
         To merge similar type of account invoices.
@@ -91,143 +128,393 @@ class AccountMove(models.Model):
 
          @param self: The object pointer.
          @param keep_references: If True, keep reference of original invoices
+         @param merge_in_place: If True, merge the invoices into one of them
+           instead of creating a new invoice (see _execute_merge_plan_in_place)
 
          @return: new account invoice id
 
         """
+        plan = self.plan_merge(
+            date_invoice=date_invoice,
+            remove_empty_invoice_lines=remove_empty_invoice_lines,
+        )
+        if merge_in_place:
+            return self._execute_merge_plan_in_place(plan)
+        return self._execute_merge_plan(plan)
+
+    # flake8: noqa: C901 (is too complex)
+    def plan_merge(self, date_invoice=False, remove_empty_invoice_lines=True):
+        """
+        Compute how the invoices would be merged, without writing anything.
+
+         @param self: The object pointer.
+         @param date_invoice: date of the new invoices
+         @param remove_empty_invoice_lines: If True, merged lines with a zero
+           quantity are dropped
 
-        def make_key(br, fields):
-            list_key = []
-            for field in fields:
-                field_val = br[field]
-                if isinstance(field_val, models.BaseModel):
-                    if br._fields.get(field).type in ("one2many", "many2many"):
-                        field_val = tuple([(6, 0, tuple(field_val.ids))])
-                    else:
-                        field_val = field_val.id
-                list_key.append((field, field_val))
-            list_key.sort()
-            return tuple(list_key)
+         @return: list of dict, one by new invoice (invoices not merged with
+           any other are skipped), with the keys:
+           * invoice_ids: ids of the invoices merged into the new invoice
+           * invoice_values: values of the new invoice, without its lines
+           * lines: list of dict {"values": values of the new line (with the
+             merged quantity), "line_ids": ids of the lines merged into it,
+             "key": merge key of these lines}
+           * dropped_lines: same as lines, for the zero quantity lines dropped
+        """
+        draft_invoices = self._get_draft_invoices()
+        key_cols_in = self._get_invoice_key_cols_in()
+        key_cols_out = self._get_invoice_key_cols_out()
+        invoice_fields = set(key_cols_in + key_cols_out)
+        invoice_fields.update(["move_type", "invoice_origin", "ref"])
+        invoice_field_types = {
+            field: self._fields[field].type for field in invoice_fields
+        }
+        line_key_cols = self._get_invoice_line_key_cols()
+        line_obj = self.env["account.move.line"]
+        line_field_types = {
+            field: line_obj._fields[field].type for field in line_key_cols
+        }
+        # Read the values of all the invoices and lines at once
+        invoices_values = self._read_merge_values(draft_invoices, list(invoice_fields))
+        lines_values = {}
+        for line_values in self._read_merge_values(
+            draft_invoices.mapped("invoice_line_ids"),
+            line_key_cols + ["move_id", "quantity"],
+        ):
+            lines_values.setdefault(line_values["move_id"], []).append(line_values)
 
         # compute what the new invoices should contain
         new_invoices = {}
+        # original line ids merged in each line of the new invoices
+        new_line_sources = {}
         seen_origins = {}
         seen_client_refs = {}
 
-        for account_invoice in self._get_draft_invoices():
-            if account_invoice.move_type in ("in_invoice", "in_refund"):
-                invoice_key = make_key(account_invoice, self._get_invoice_key_cols_in())
+        for invoice_values in invoices_values:
+            if invoice_values["move_type"] in ("in_invoice", "in_refund"):
+                key_cols = key_cols_in
             else:
-                invoice_key = make_key(
-                    account_invoice, self._get_invoice_key_cols_out()
-                )
+                key_cols = key_cols_out
+            invoice_key = self._get_merge_key(
+                invoice_values, key_cols, invoice_field_types
+            )
             new_invoice = new_invoices.setdefault(invoice_key, ({}, []))
+            line_sources = new_line_sources.setdefault(invoice_key, {})
             origins = seen_origins.setdefault(invoice_key, set())
             client_refs = seen_client_refs.setdefault(invoice_key, set())
-            new_invoice[1].append(account_invoice.id)
+            new_invoice[1].append(invoice_values["id"])
             invoice_infos = new_invoice[0]
+            invoice_origin = invoice_values["invoice_origin"]
+            ref = invoice_values["ref"]
             if not invoice_infos:
-                invoice_infos.update(self._get_first_invoice_fields(account_invoice))
-                origins.add(account_invoice.invoice_origin)
-                client_refs.add(account_invoice.ref)
+                invoice_infos.update(
+                    self._get_first_invoice_fields(self.browse(invoice_values["id"]))
+                )
+                origins.add(invoice_origin)
+                client_refs.add(ref)
             else:
-                if (
-                    account_invoice.invoice_origin
-                    and account_invoice.invoice_origin not in origins
-                ):
+                if invoice_origin and invoice_origin not in origins:
                     invoice_infos["invoice_origin"] = (
-                        (invoice_infos["invoice_origin"] or "")
-                        + " "
-                        + account_invoice.invoice_origin
-                    )
-                    origins.add(account_invoice.invoice_origin)
-                if account_invoice.ref and account_invoice.ref not in client_refs:
-                    invoice_infos["ref"] = (
-                        (invoice_infos["ref"] or "") + " " + account_invoice.ref
+                        (invoice_infos["invoice_origin"] or "") + " " + invoice_origin
                     )
-                    client_refs.add(account_invoice.ref)
+                    origins.add(invoice_origin)
+                if ref and ref not in client_refs:
+                    invoice_infos["ref"] = (invoice_infos["ref"] or "") + " " + ref
+                    client_refs.add(ref)
 
-            for invoice_line in account_invoice.invoice_line_ids:
-                line_key = make_key(invoice_line, self._get_invoice_line_key_cols())
+            for line_values in lines_values.get(invoice_values["id"], []):
+                line_key = self._get_merge_key(
+                    line_values, line_key_cols, line_field_types
+                )
 
                 o_line = invoice_infos["invoice_line_ids"].setdefault(line_key, {})
+                line_sources.setdefault(line_key, []).append(line_values["id"])
 
                 if o_line:
                     # merge the line with an existing line
-                    o_line["quantity"] += invoice_line.quantity
+                    o_line["quantity"] += line_values["quantity"]
                 else:
                     # append a new "standalone" line
-                    o_line["quantity"] = invoice_line.quantity
+                    o_line["quantity"] = line_values["quantity"]
 
-        allinvoices = []
-        allnewinvoices = []
-        invoices_info = {}
-        old_invoices = self.browse()
+        plan = []
         qty_prec = self.env["decimal.precision"].precision_get(
             "Product Unit of Measure"
         )
-        for _invoice_key, (invoice_data, old_ids) in new_invoices.items():
+        for invoice_key, (invoice_data, old_ids) in new_invoices.items():
             # skip merges with only one invoice
             if len(old_ids) < 2:
-                allinvoices += old_ids or []
                 continue
-            # cleanup invoice line data
-            for key, value in invoice_data["invoice_line_ids"].items():
+            line_sources = new_line_sources[invoice_key]
+            lines = []
+            dropped_lines = []
+            for key, value in invoice_data.pop("invoice_line_ids").items():
+                # cleanup invoice line data
                 value.update(dict(key))
-
-            if remove_empty_invoice_lines:
-                invoice_data["invoice_line_ids"] = [
-                    (0, 0, value)
-                    for value in invoice_data["invoice_line_ids"].values()
-                    if not float_is_zero(value["quantity"], precision_digits=qty_prec)
-                ]
-            else:
-                invoice_data["invoice_line_ids"] = [
-                    (0, 0, value) for value in invoice_data["invoice_line_ids"].values()
-                ]
-
+                line = {"values": value, "line_ids": line_sources[key], "key": key}
+                if remove_empty_invoice_lines and float_is_zero(
+                    value["quantity"], precision_digits=qty_prec
+                ):
+                    dropped_lines.append(line)
+                else:
+                    lines.append(line)
             if date_invoice:
                 invoice_data["date"] = date_invoice
+            plan.append(
+                {
+                    "invoice_ids": old_ids,
+                    "invoice_values": invoice_data,
+                    "lines": lines,
+                    "dropped_lines": dropped_lines,
+                }
+            )
+        return plan
+
+    @api.model
+    def _execute_merge_plan(self, plan):
+        """
+        Create the new invoices and cancel the merged ones, as computed by
+        plan_merge
+
+         @param plan: list of dict (see plan_merge)
 
+         @return: dict {new invoice id: ids of the invoices merged into it}
+        """
+        allnewinvoices = []
+        invoices_info = {}
+        # {original line id: new line id}
+        line_mapping = {}
+        for group in plan:
+            invoice_data = dict(
+                group["invoice_values"],
+                invoice_line_ids=[(0, 0, line["values"]) for line in group["lines"]],
+            )
             # create the new invoice
             newinvoice = self.with_context(is_merge=True).create(invoice_data)
-            invoices_info.update({newinvoice.id: old_ids})
-            allinvoices.append(newinvoice.id)
+            invoices_info.update({newinvoice.id: group["invoice_ids"]})
             allnewinvoices.append(newinvoice)
+            line_mapping.update(
+                self._map_merged_invoice_lines(
+                    group["lines"], newinvoice.invoice_line_ids
+                )
+            )
             # cancel old invoices
-            old_invoices = self.browse(old_ids)
+            old_invoices = self.browse(group["invoice_ids"])
             old_invoices.with_context(is_merge=True).button_cancel()
 
-        # Make link between original sale order
-        # None if sale is not installed
-        invoice_line_obj = self.env["account.move.line"]
-        for new_invoice_id in invoices_info:
-            if "sale.order" in self.env.registry:
-                sale_todos = old_invoices.mapped(
-                    "invoice_line_ids.sale_line_ids.order_id"
-                )
-                for org_so in sale_todos:
-                    for so_line in org_so.order_line:
-                        invoice_line = invoice_line_obj.search(
-                            [
-                                ("id", "in", so_line.invoice_lines.ids),
-                                ("move_id", "=", new_invoice_id),
-                            ]
-                        )
-                        if invoice_line:
-                            so_line.write({"invoice_lines": [(6, 0, invoice_line.ids)]})
-
-        # recreate link (if any) between original analytic account line
-        # (invoice time sheet for example) and this new invoice
-        anal_line_obj = self.env["account.analytic.line"]
-        if "move_id" in anal_line_obj._fields:
-            for new_invoice_id in invoices_info:
-                anal_todos = anal_line_obj.search(
-                    [("move_id", "in", invoices_info[new_invoice_id])]
-                )
-                anal_todos.write({"move_id": new_invoice_id})
+        self._relink_merged_invoice_lines(line_mapping)
 
         for new_invoice in allnewinvoices:
             new_invoice._compute_amount()
 
         return invoices_info
+
+    @api.model
+    def _map_merged_invoice_lines(self, lines, new_lines):
+        """
+        Map the original invoice lines to the lines created by merging them,
+        matched by their merge key: the created lines may be in another order
+        or come with other lines (a rounding line for example)
+
+         @param lines: list of dict, lines of the plan (see plan_merge)
+         @param new_lines: account.move.line recordset, lines created
+
+         @return: dict {original line id: new line id}
+        """
+        line_key_cols = self._get_invoice_line_key_cols()
+        line_obj = self.env["account.move.line"]
+        line_field_types = {
+            field: line_obj._fields[field].type for field in line_key_cols
+        }
+        new_line_ids = {}
+        for line_values in self._read_merge_values(new_lines, line_key_cols):
+            line_key = self._get_merge_key(line_values, line_key_cols, line_field_types)
+            new_line_ids.setdefault(line_key, []).append(line_values["id"])
+        line_mapping = {}
+        for line in lines:
+            matching_ids = new_line_ids.get(line["key"], [])
+            if len(matching_ids) != 1:
+                raise UserError(
+                    _(
+                        "Merged invoice lines %s match %s created lines "
+                        "instead of one."
+                    )
+                    % (line["line_ids"], len(matching_ids))
+                )
+            for old_line_id in line["line_ids"]:
+                line_mapping[old_line_id] = matching_ids[0]
+        return line_mapping
+
+    @api.model
+    def _get_merge_target_invoice(self, invoices):
+        """
+        Overridable function to return the invoice into which the others are
+        merged in place: by default the one with the most lines
+
+         @param invoices: account.move recordset of a group to merge
+
+         @return: account.move record
+        """
+        return invoices.sorted(lambda i: (-len(i.invoice_line_ids), i.id))[:1]
+
+    @api.model
+    def _execute_merge_plan_in_place(self, plan):
+        """
+        Merge the invoices of each group of the plan into one of them (the
+        target, see _get_merge_target_invoice): lines are aggregated into the
+        lines of the target or appended to it, then the other invoices are
+        deleted (cancelled if they have been posted once). Only the lines
+        added to the target are written, so its taxes and payment terms are
+        recomputed once by group.
+
+         @param plan: list of dict (see plan_merge)
+
+         @return: dict {target invoice id: ids of the invoices merged into it}
+        """
+        invoices_info = {}
+        # {original line id: target line id}, lines of the targets
+        line_mapping = {}
+        # [(target, values written, lines created, ids of the target lines)]
+        target_writes = []
+        line_obj = self.env["account.move.line"]
+        qty_prec = self.env["decimal.precision"].precision_get(
+            "Product Unit of Measure"
+        )
+        for group in plan:
+            invoices = self.browse(group["invoice_ids"])
+            target = self._get_merge_target_invoice(invoices)
+            target_line_ids = set(target.invoice_line_ids.ids)
+            commands = []
+            new_lines = []
+            lines = [(line, False) for line in group["lines"]]
+            lines += [(line, True) for line in group["dropped_lines"]]
+            for line, dropped in lines:
+                quantity = line["values"]["quantity"]
+                line_ids = [i for i in line["line_ids"] if i in target_line_ids]
+                if not line_ids:
+                    if not dropped:
+                        commands.append((0, 0, line["values"]))
+                        new_lines.append(line)
+                    continue
+                if dropped:
+                    commands.extend((2, line_id) for line_id in line_ids)
+                    continue
+                # aggregate the lines into the first line of the target
+                target_line = line_obj.browse(line_ids[0])
+                if float_compare(
+                    target_line.quantity, quantity, precision_digits=qty_prec
+                ):
+                    commands.append((1, target_line.id, {"quantity": quantity}))
+                for old_line_id in line["line_ids"]:
+                    if old_line_id != target_line.id:
+                        line_mapping[old_line_id] = target_line.id
+                commands.extend((2, line_id) for line_id in line_ids[1:])
+            values = {
+                key: group["invoice_values"][key]
+                for key in ("invoice_origin", "ref", "date")
+                if key in group["invoice_values"]
+            }
+            if commands:
+                values["invoice_line_ids"] = commands
+            target_writes.append((target, values, new_lines, target_line_ids))
+            invoices_info[target.id] = (invoices - target).ids
+
+        # the links of the lines deleted from the targets are moved first
+        self._relink_merged_invoice_lines(line_mapping)
+        # {original line id: created line id}
+        new_line_mapping = {}
+        for target, values, new_lines, target_line_ids in target_writes:
+            target.with_context(is_merge=True).write(values)
+            created_lines = target.invoice_line_ids.filtered(
+                lambda line, ids=target_line_ids: line.id not in ids
+            )
+            new_line_mapping.update(
+                self._map_merged_invoice_lines(new_lines, created_lines)
+            )
+        self._relink_merged_invoice_lines(new_line_mapping)
+
+        old_invoices = self.browse(
+            [old_id for old_ids in invoices_info.values() for old_id in old_ids]
+        )
+        posted_invoices = old_invoices.filtered("posted_before")
+        posted_invoices.with_context(is_merge=True).button_cancel()
+        (old_invoices - posted_invoices).with_context(is_merge=True).unlink()
+        return invoices_info
+
+    @api.model
+    def _relink_merged_invoice_lines(self, line_mapping):
+        """
+        Move the links of the original invoice lines to the lines they are
+        merged into: sale order lines (None if sale is not installed) and
+        analytic lines (invoice time sheet for example).
+        :param line_mapping: dict {original line id: new line id}
+        """
+        if not line_mapping:
+            return
+        self.flush()
+        old_line_ids = list(line_mapping)
+        new_line_ids = [line_mapping[line_id] for line_id in old_line_ids]
+        mapping_params = (old_line_ids, new_line_ids)
+        line_obj = self.env["account.move.line"]
+        sale_line_field = line_obj._fields.get("sale_line_ids")
+        if sale_line_field:
+            query = sql.SQL(
+                """
+                INSERT INTO {relation} ({line_column}, {sale_line_column})
+                SELECT mapping.new_id, rel.{sale_line_column}
+                FROM {relation} rel
+                JOIN unnest(%s::int[], %s::int[]) AS mapping(old_id, new_id)
+                    ON rel.{line_column} = mapping.old_id
+                ON CONFLICT DO NOTHING
+                """
+            ).format(
+                relation=sql.Identifier(sale_line_field.relation),
+                line_column=sql.Identifier(sale_line_field.column1),
+                sale_line_column=sql.Identifier(sale_line_field.column2),
+            )
+            self.env.cr.execute(query, mapping_params)
+            query = sql.SQL(
+                """
+                DELETE FROM {relation}
+                WHERE {line_column} IN %s
+                RETURNING {sale_line_column}
+                """
+            ).format(
+                relation=sql.Identifier(sale_line_field.relation),
+                line_column=sql.Identifier(sale_line_field.column1),
+                sale_line_column=sql.Identifier(sale_line_field.column2),
+            )
+            self.env.cr.execute(query, (tuple(old_line_ids),))
+            sale_line_obj = self.env[sale_line_field.comodel_name]
+            sale_lines = sale_line_obj.browse(
+                {row[0] for row in self.env.cr.fetchall()}
+            )
+            # fields of sale lines stored in the same relation (invoice_lines)
+            sale_line_fnames = [
+                name
+                for name, field in sale_line_obj._fields.items()
+                if field.type == "many2many"
+                and field.relation == sale_line_field.relation
+            ]
+            line_obj.invalidate_cache(["sale_line_ids"])
+            sale_line_obj.invalidate_cache(sale_line_fnames)
+            line_obj.browse(old_line_ids + new_line_ids).modified(["sale_line_ids"])
+            sale_lines.modified(sale_line_fnames)
+        anal_line_obj = self.env["account.analytic.line"]
+        move_field = anal_line_obj._fields.get("move_id")
+        if move_field and move_field.comodel_name == line_obj._name:
+            self.env.cr.execute(
+                """
+                UPDATE account_analytic_line aal
+                SET move_id = mapping.new_id
+                FROM unnest(%s::int[], %s::int[]) AS mapping(old_id, new_id)
+                WHERE aal.move_id = mapping.old_id
+                RETURNING aal.id
+                """,
+                mapping_params,
+            )
+            anal_lines = anal_line_obj.browse(
+                [row[0] for row in self.env.cr.fetchall()]
+            )
+            anal_lines.invalidate_cache(["move_id"], anal_lines.ids)
+            anal_lines.modified(["move_id"])
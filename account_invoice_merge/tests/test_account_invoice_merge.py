@@ -209,3 +209,165 @@ class TestAccountInvoiceMerge(TransactionCase):
         ).create({})
         wiz_id.fields_view_get()
         wiz_id.merge_invoices()
+
+    def test_account_invoice_merge_lines(self):
+        invoice4 = self._create_invoice(self.partner1, "D")
+        line4 = self._create_inv_line(invoice4)
+        self._create_inv_line(invoice4).write({"price_unit": 5.0})
+        line4.write({"discount": 10.0})
+        invoices = self.invoice1 | self.invoice2 | invoice4
+        invoices_info = invoices.do_merge()
+        self.assertEqual(len(invoices_info), 1)
+        new_invoice = self.inv_model.browse(list(invoices_info))
+        self.assertEqual(sorted(invoices_info[new_invoice.id]), sorted(invoices.ids))
+        lines = new_invoice.invoice_line_ids
+        self.assertEqual(len(lines), 3)
+        merged_line = lines.filtered(lambda line: line.quantity == 2.0)
+        self.assertEqual(merged_line.tax_ids, self.invoice_line1.tax_ids)
+        self.assertEqual(merged_line.price_unit, 3.0)
+        self.assertFalse(merged_line.discount)
+        self.assertEqual(sorted(lines.mapped("price_unit")), [3.0, 3.0, 5.0])
+        self.assertEqual(sorted(lines.mapped("discount")), [0.0, 0.0, 10.0])
+        self.assertEqual(set(invoices.mapped("state")), {"cancel"})
+
+    def test_map_merged_invoice_lines(self):
+        invoice4 = self._create_invoice(self.partner1, "D")
+        line4 = self._create_inv_line(invoice4)
+        line5 = self._create_inv_line(invoice4)
+        line5.write({"price_unit": 5.0})
+        invoices = self.invoice1 | self.invoice2 | invoice4
+        lines = invoices.plan_merge()[0]["lines"]
+        self.assertEqual(len(lines), 2)
+        # The lines are matched by their key, whatever their order, and the
+        # other lines are ignored
+        self._create_inv_line(invoice4).write({"price_unit": 7.0})
+        mapping = self.inv_model._map_merged_invoice_lines(
+            list(reversed(lines)), invoice4.invoice_line_ids
+        )
+        self.assertEqual(
+            mapping,
+            {
+                self.invoice_line1.id: line4.id,
+                self.invoice_line2.id: line4.id,
+                line4.id: line4.id,
+                line5.id: line5.id,
+            },
+        )
+        with self.assertRaises(UserError):
+            self.inv_model._map_merged_invoice_lines(lines, line4)
+
+    def test_account_invoice_merge_relink_analytic_lines(self):
+        analytic_account = self.env["account.analytic.account"].create(
+            {"name": "Test Merge Analytic Account"}
+        )
+        analytic_lines = self.env["account.analytic.line"].create(
+            [
+                {
+                    "name": "Test analytic line",
+                    "account_id": analytic_account.id,
+                    "move_id": line.id,
+                }
+                for line in self.invoice_line1 | self.invoice_line2
+            ]
+        )
+        invoices = self.invoice1 | self.invoice2
+        invoices_info = invoices.do_merge()
+        new_invoice = self.inv_model.browse(list(invoices_info))
+        self.assertEqual(analytic_lines.mapped("move_id"), new_invoice.invoice_line_ids)
+
+    def test_account_invoice_plan_merge(self):
+        invoice4 = self._create_invoice(self.partner1, "D")
+        self._create_inv_line(invoice4).write({"quantity": -2.0})
+        invoices = self.invoice1 | self.invoice2 | self.invoice3 | invoice4
+        nb_invoices = self.inv_model.search_count([])
+        plan = invoices.plan_merge()
+        self.assertEqual(self.inv_model.search_count([]), nb_invoices)
+        self.assertEqual(len(plan), 1)
+        group = plan[0]
+        self.assertEqual(
+            sorted(group["invoice_ids"]),
+            sorted((self.invoice1 | self.invoice2 | invoice4).ids),
+        )
+        self.assertEqual(group["invoice_values"]["partner_id"], self.partner1.id)
+        self.assertFalse(group["lines"])
+        self.assertEqual(len(group["dropped_lines"]), 1)
+        dropped_line = group["dropped_lines"][0]
+        self.assertEqual(dropped_line["values"]["quantity"], 0.0)
+        self.assertEqual(len(dropped_line["line_ids"]), 3)
+        plan = invoices.plan_merge(remove_empty_invoice_lines=False)
+        self.assertEqual(len(plan[0]["lines"]), 1)
+        self.assertFalse(plan[0]["dropped_lines"])
+        wiz = self.wiz.with_context(
+            active_ids=invoices.ids,
+            active_model=invoices._name,
+        ).create({})
+        self.assertEqual(wiz.preview_invoice_count, 1)
+        self.assertEqual(wiz.preview_merged_invoice_count, 3)
+        self.assertEqual(wiz.preview_line_count, 0)
+        self.assertEqual(wiz.preview_dropped_line_count, 1)
+
+    def test_account_invoice_merge_in_place_preview(self):
+        invoice4 = self._create_invoice(self.partner1, "D")
+        self._create_inv_line(invoice4)
+        self._create_inv_line(invoice4).write({"price_unit": 5.0})
+        invoice5 = self._create_invoice(self.partner1, "E")
+        self._create_inv_line(invoice5).write({"price_unit": 7.0})
+        invoices = self.invoice1 | self.invoice2 | invoice4 | invoice5
+        wiz = self.wiz.with_context(
+            active_ids=invoices.ids,
+            active_model=invoices._name,
+        ).create({})
+        self.assertEqual(wiz.preview_invoice_count, 1)
+        self.assertEqual(wiz.preview_target_invoice_count, 0)
+        self.assertEqual(wiz.preview_merged_invoice_count, 4)
+        self.assertEqual(wiz.preview_line_count, 3)
+        wiz.merge_in_place = True
+        # No invoice is created, only the line of invoice5 is added
+        self.assertEqual(wiz.preview_invoice_count, 0)
+        self.assertEqual(wiz.preview_target_invoice_count, 1)
+        self.assertEqual(wiz.preview_merged_invoice_count, 4)
+        self.assertEqual(wiz.preview_line_count, 1)
+
+    def test_account_invoice_merge_in_place(self):
+        invoice4 = self._create_invoice(self.partner1, "D")
+        self._create_inv_line(invoice4)
+        self._create_inv_line(invoice4).write({"price_unit": 5.0})
+        invoice5 = self._create_invoice(self.partner1, "E")
+        self._create_inv_line(invoice5).write({"price_unit": 7.0})
+        target_lines = invoice4.invoice_line_ids
+        invoices = self.invoice1 | self.invoice2 | invoice4 | invoice5
+        nb_invoices = self.inv_model.search_count([])
+        invoices_info = invoices.do_merge(merge_in_place=True)
+        self.assertEqual(list(invoices_info), invoice4.ids)
+        self.assertEqual(
+            sorted(invoices_info[invoice4.id]),
+            sorted((self.invoice1 | self.invoice2 | invoice5).ids),
+        )
+        # No invoice created, merged invoices deleted
+        self.assertEqual(self.inv_model.search_count([]), nb_invoices - 3)
+        self.assertFalse((self.invoice1 | self.invoice2 | invoice5).exists())
+        self.assertEqual(invoice4.state, "draft")
+        lines = invoice4.invoice_line_ids
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(target_lines <= lines)
+        self.assertEqual(
+            sorted((line.price_unit, line.quantity) for line in lines),
+            [(3.0, 3.0), (5.0, 1.0), (7.0, 1.0)],
+        )
+        self.assertEqual(invoice4.amount_untaxed, 21.0)
+
+    def test_account_invoice_merge_in_place_dropped_lines(self):
+        invoice4 = self._create_invoice(self.partner1, "D")
+        self._create_inv_line(invoice4)
+        self._create_inv_line(invoice4)
+        kept_line = self._create_inv_line(invoice4)
+        kept_line.write({"price_unit": 5.0})
+        invoice5 = self._create_invoice(self.partner1, "E")
+        self._create_inv_line(invoice5).write({"quantity": -2.0})
+        invoices = invoice4 | invoice5
+        invoices_info = invoices.do_merge(merge_in_place=True)
+        self.assertEqual(list(invoices_info), invoice4.ids)
+        self.assertFalse(invoice5.exists())
+        # Every line of the target merged into a dropped line is deleted
+        self.assertEqual(invoice4.invoice_line_ids, kept_line)
+        self.assertEqual(invoice4.amount_untaxed, 5.0)
@@ -18,6 +18,76 @@ class InvoiceMerge(models.TransientModel):
         "Keep references from original invoices", default=True
     )
     date_invoice = fields.Date("Invoice Date")
+    merge_in_place = fields.Boolean(
+        "Merge Into Existing Draft",
+        help="Merge the invoices into the one having the most lines, instead "
+        "of creating a new invoice. Merged invoices are deleted (or cancelled "
+        "if they have been posted once).",
+    )
+    preview_invoice_count = fields.Integer(
+        "Invoices to Create", compute="_compute_preview"
+    )
+    preview_target_invoice_count = fields.Integer(
+        "Invoices to Merge Into", compute="_compute_preview"
+    )
+    preview_merged_invoice_count = fields.Integer(
+        "Invoices to Merge", compute="_compute_preview"
+    )
+    preview_line_count = fields.Integer("Lines to Create", compute="_compute_preview")
+    preview_dropped_line_count = fields.Integer(
+        "Zero Quantity Lines to Drop", compute="_compute_preview"
+    )
+
+    @api.model
+    def _get_preview_new_line_count(self, plan, merge_in_place):
+        """Count the lines created by the merge: when merging in place, only
+        the lines not aggregated into a line of the target are created.
+
+        :param plan: list of dict (see plan_merge)
+        :param merge_in_place: bool
+        :return: int
+        """
+        if not merge_in_place:
+            return sum(len(group["lines"]) for group in plan)
+        move_obj = self.env["account.move"]
+        count = 0
+        for group in plan:
+            target = move_obj._get_merge_target_invoice(
+                move_obj.browse(group["invoice_ids"])
+            )
+            target_line_ids = set(target.invoice_line_ids.ids)
+            count += len(
+                [
+                    line
+                    for line in group["lines"]
+                    if not target_line_ids.intersection(line["line_ids"])
+                ]
+            )
+        return count
+
+    @api.depends("date_invoice", "merge_in_place")
+    def _compute_preview(self):
+        """Preview the merge of the selected invoices (nothing is written)"""
+        plan = []
+        if self.env.context.get("active_model", "") == "account.move":
+            invoices = self.env["account.move"].browse(
+                self.env.context.get("active_ids", [])
+            )
+            plan = invoices.plan_merge(date_invoice=self.date_invoice)
+        for wizard in self:
+            merge_in_place = wizard.merge_in_place
+            # Merging in place doesn't create any invoice
+            wizard.preview_invoice_count = 0 if merge_in_place else len(plan)
+            wizard.preview_target_invoice_count = len(plan) if merge_in_place else 0
+            wizard.preview_merged_invoice_count = sum(
+                len(group["invoice_ids"]) for group in plan
+            )
+            wizard.preview_line_count = self._get_preview_new_line_count(
+                plan, merge_in_place
+            )
+            wizard.preview_dropped_line_count = sum(
+                len(group["dropped_lines"]) for group in plan
+            )
 
     @api.model
     def _get_not_mergeable_invoices_message(self, invoices):
@@ -87,16 +157,18 @@ class InvoiceMerge(models.TransientModel):
         aw_obj = self.env["ir.actions.act_window"]
         ids = self.env.context.get("active_ids", [])
         invoices = inv_obj.browse(ids)
-        allinvoices = invoices.do_merge(
-            keep_references=self.keep_references, date_invoice=self.date_invoice
-        )
         xid = {
             "out_invoice": "account.action_move_out_invoice_type",
             "out_refund": "account.action_move_out_refund_type",
             "in_invoice": "account.action_move_in_invoice_type",
             "in_refund": "account.action_move_in_refund_type",
         }[fields.first(invoices).move_type]
+        allinvoices = invoices.do_merge(
+            keep_references=self.keep_references,
+            date_invoice=self.date_invoice,
+            merge_in_place=self.merge_in_place,
+        )
 
         res = aw_obj._for_xml_id(xid)
-        res["domain"] = [("id", "in", ids + list(allinvoices.keys()))]
+        res["domain"] = [("id", "in", invoices.exists().ids + list(allinvoices.keys()))]
         return res
@@ -0,0 +1,19 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
+
+{
+    "name": "Account Invoice Merge Queued",
+    "summary": "Merge invoices in background jobs, one job per group",
+    "version": "14.0.1.0.0",
+    "category": "Finance",
+    "author": "Odoo Community Association (OCA)",
+    "website": "https://github.com/OCA/account-invoicing",
+    "license": "AGPL-3",
+    "depends": ["account_invoice_merge", "queue_job"],
+    "data": [
+        "data/queue_job.xml",
+        "views/queue_job_views.xml",
+        "views/account_move_views.xml",
+        "wizard/invoice_merge_view.xml",
+    ],
+    "installable": True,
+}
@@ -0,0 +1,67 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
+
+from odoo import _, api, fields, models
+from odoo.tools import html_escape
+
+
+class AccountMove(models.Model):
+    _inherit = "account.move"
+
+    merge_job_ids = fields.Many2many(
+        comodel_name="queue.job",
+        column1="invoice_id",
+        column2="job_id",
+        string="Merge Jobs",
+        relation="account_move_merge_job_rel",
+        copy=False,
+    )
+
+    def merge_invoices_job(self, date_invoice=False, merge_in_place=False):
+        """
+        Merge current invoices (executed in a job)
+        :param date_invoice: str
+        :param merge_in_place: bool
+        :return: str
+        """
+        names = dict(zip(self.ids, self.mapped("display_name")))
+        invoices_info = self.do_merge(
+            date_invoice=date_invoice, merge_in_place=merge_in_place
+        )
+        if not invoices_info:
+            return _("No invoice merged.")
+        new_invoices = self.browse(list(invoices_info))
+        return "\n".join(
+            _("Invoices %s merged into %s")
+            % (
+                ", ".join(names[old_id] for old_id in old_ids),
+                new_invoice.display_name,
+            )
+            for new_invoice, old_ids in zip(new_invoices, invoices_info.values())
+        )
+
+    @api.model
+    def merge_invoices_done_job(self):
+        """
+        Notify the user who enqueued the merge with the results of all the
+        merge jobs (executed in a job once all of them are done)
+        :return: str
+        """
+        job_obj = self.env["queue.job"].sudo()
+        job = job_obj.search([("uuid", "=", self.env.context.get("job_uuid"))])
+        merge_jobs = job_obj.browse()
+        if job.graph_uuid:
+            merge_jobs = job_obj.search(
+                [("graph_uuid", "=", job.graph_uuid), ("id", "!=", job.id)]
+            )
+        results = [merge_job.result or merge_job.name for merge_job in merge_jobs]
+        summary = _("%s merge jobs done.") % len(merge_jobs)
+        body = "<p>%s</p><ul>%s</ul>" % (
+            html_escape(summary),
+            "".join("<li>%s</li>" % html_escape(result) for result in results),
+        )
+        self.env["mail.thread"].message_notify(
+            partner_ids=self.env.user.partner_id.ids,
+            subject=_("Invoices merged"),
+            body=body,
+        )
+        return "\n".join([summary] + results)
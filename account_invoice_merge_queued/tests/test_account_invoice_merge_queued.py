@@ -0,0 +1,97 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
+
+from odoo.exceptions import UserError
+from odoo.tests import SavepointCase, tagged
+
+
+@tagged("post_install", "-at_install")
+class TestAccountInvoiceMergeQueued(SavepointCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.inv_model = cls.env["account.move"]
+        cls.wiz = cls.env["invoice.merge"]
+        cls.queue_obj = cls.env["queue.job"]
+        cls.product = cls.env.ref("product.product_product_8")
+        cls.journal = cls.env["account.journal"].search(
+            [("type", "=", "sale")], limit=1
+        )
+        cls.partner = cls.env["res.partner"].create(
+            {"name": "Test Partner", "company_type": "company"}
+        )
+        cls.invoices = cls.inv_model.browse()
+        for _index in range(5):
+            cls.invoices |= cls._create_invoice()
+
+    @classmethod
+    def _create_invoice(cls):
+        return cls.inv_model.create(
+            {
+                "partner_id": cls.partner.id,
+                "move_type": "out_invoice",
+                "journal_id": cls.journal.id,
+                "invoice_line_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": "test invoice line",
+                            "quantity": 1.0,
+                            "price_unit": 3.0,
+                            "product_id": cls.product.id,
+                        },
+                    )
+                ],
+            }
+        )
+
+    def _get_wizard(self, **values):
+        return self.wiz.with_context(
+            active_ids=self.invoices.ids, active_model=self.invoices._name
+        ).create(dict(values, enqueue=True))
+
+    def test_split_job_invoices(self):
+        wizard = self._get_wizard(job_size=2)
+        chunks = wizard._split_job_invoices(self.invoices.plan_merge())
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 2])
+        self.assertEqual(self.inv_model.union(*chunks), self.invoices)
+        wizard.job_size = 100
+        chunks = wizard._split_job_invoices(self.invoices.plan_merge())
+        self.assertEqual(chunks, [self.invoices])
+
+    def test_enqueue_merge(self):
+        wizard = self._get_wizard(job_size=3)
+        prev_jobs = self.queue_obj.search([])
+        wizard.merge_invoices()
+        jobs = self.queue_obj.search([]) - prev_jobs
+        # 2 merge jobs and the notification job
+        self.assertEqual(len(jobs), 3)
+        merge_jobs = self.invoices.mapped("merge_job_ids")
+        self.assertEqual(len(merge_jobs), 2)
+        self.assertEqual(
+            set(merge_jobs.mapped("graph_uuid")), set(jobs.mapped("graph_uuid"))
+        )
+        self.assertEqual(set(self.invoices.mapped("state")), {"draft"})
+        # Try to enqueue the merge again
+        with self.assertRaises(UserError):
+            self._get_wizard().merge_invoices()
+
+    def test_merge_invoices_job(self):
+        result = self.invoices.merge_invoices_job()
+        self.assertEqual(set(self.invoices.mapped("state")), {"cancel"})
+        new_invoice = self.inv_model.search(
+            [("partner_id", "=", self.partner.id), ("state", "=", "draft")]
+        )
+        self.assertEqual(len(new_invoice), 1)
+        self.assertEqual(new_invoice.invoice_line_ids.quantity, 5.0)
+        self.assertIn(new_invoice.display_name, result)
+
+    def test_merge_invoices_done_job(self):
+        partner = self.env.user.partner_id
+        messages = self.env["mail.message"].search([("partner_ids", "in", partner.ids)])
+        self.inv_model.merge_invoices_done_job()
+        new_messages = (
+            self.env["mail.message"].search([("partner_ids", "in", partner.ids)])
+            - messages
+        )
+        self.assertEqual(len(new_messages), 1)
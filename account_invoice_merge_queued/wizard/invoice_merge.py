@@ -0,0 +1,119 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
+
+import math
+
+from odoo import _, fields, models
+from odoo.exceptions import UserError
+
+from odoo.addons.queue_job.delay import group
+
+
+class InvoiceMerge(models.TransientModel):
+    _inherit = "invoice.merge"
+
+    enqueue = fields.Boolean(
+        "Enqueue Merge",
+        help="Merge the invoices in background jobs: one job per group of "
+        "invoices to merge, committed (or retried) on its own. You are "
+        "notified when all the jobs are done.",
+    )
+    job_size = fields.Integer(
+        default=100,
+        help="Maximum number of invoices merged by a job. Bigger groups of "
+        "invoices are split into several jobs (and new invoices).",
+    )
+
+    def merge_invoices(self):
+        """Inherit to enqueue the merge"""
+        if not self.enqueue:
+            return super().merge_invoices()
+        self._enqueue_merge_invoices()
+        invoices = self.env["account.move"].browse(
+            self.env.context.get("active_ids", [])
+        )
+        xid = {
+            "out_invoice": "account.action_move_out_invoice_type",
+            "out_refund": "account.action_move_out_refund_type",
+            "in_invoice": "account.action_move_in_invoice_type",
+            "in_refund": "account.action_move_in_refund_type",
+        }[fields.first(invoices).move_type]
+        action = self.env["ir.actions.act_window"]._for_xml_id(xid)
+        action["domain"] = [("id", "in", invoices.ids)]
+        return action
+
+    def _split_job_invoices(self, plan):
+        """
+        Split the groups of invoices to merge into the invoices merged by each
+        job. Groups bigger than the job size are split in parts as even as
+        possible, of at least 2 invoices.
+        :param plan: list of dict (see account.move.plan_merge)
+        :return: list of account.move recordset
+        """
+        self.ensure_one()
+        chunks = []
+        for merge_group in plan:
+            invoice_ids = merge_group["invoice_ids"]
+            nb_chunks = min(
+                math.ceil(len(invoice_ids) / self.job_size), len(invoice_ids) // 2
+            )
+            size, remainder = divmod(len(invoice_ids), nb_chunks)
+            start = 0
+            for index in range(nb_chunks):
+                end = start + size + (1 if index < remainder else 0)
+                chunks.append(self.env["account.move"].browse(invoice_ids[start:end]))
+                start = end
+        return chunks
+
+    def _enqueue_merge_invoices(self):
+        """
+        Enqueue one job per group of invoices to merge, and a job notifying
+        the user when all of them are done
+        :return: queue.job recordset
+        """
+        self.ensure_one()
+        if self.job_size < 2:
+            raise UserError(_("A job must merge at least 2 invoices."))
+        invoices = self.env["account.move"].browse(
+            self.env.context.get("active_ids", [])
+        )
+        enqueued_invoices = invoices.sudo().filtered(
+            lambda i: i.merge_job_ids.filtered(
+                lambda j: j.state
+                in {"wait_dependencies", "pending", "enqueued", "started"}
+            )
+        )
+        if enqueued_invoices:
+            raise UserError(
+                _(
+                    "There's already an enqueued job for merging the invoices "
+                    "%s. Please wait until it's finished or remove them "
+                    "from the selection."
+                )
+                % ", ".join(enqueued_invoices.mapped("display_name"))
+            )
+        chunks = self._split_job_invoices(invoices.plan_merge())
+        if not chunks:
+            raise UserError(_("No invoice to merge."))
+        date_invoice = fields.Date.to_string(self.date_invoice)
+        delayables = [
+            chunk.delayable(
+                description=_("Merge invoices %s")
+                % ", ".join(chunk.mapped("display_name"))
+            ).merge_invoices_job(
+                date_invoice=date_invoice, merge_in_place=self.merge_in_place
+            )
+            for chunk in chunks
+        ]
+        merge_group = group(*delayables)
+        merge_group.on_done(
+            self.env["account.move"]
+            .delayable(description=_("Notify invoices merge"))
+            .merge_invoices_done_job()
+        )
+        merge_group.delay()
+        jobs = self.env["queue.job"].sudo()
+        for chunk, delayable in zip(chunks, delayables):
+            job = delayable._generated_job.db_record()
+            chunk.sudo().write({"merge_job_ids": [(4, job.id)]})
+            jobs |= job
+        return jobs
@@ -2,7 +2,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 {
     "name": "Account Invoice Mode At Shipping",
-    "version": "14.0.1.2.0",
+    "version": "14.0.1.3.0",
     "summary": "Create invoices automatically when goods are shipped.",
     "author": "Camptocamp, Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/account-invoicing",
@@ -10,6 +10,7 @@
     "category": "Accounting & Finance",
     "data": [
         "data/queue_job_data.xml",
+        "data/ir_cron.xml",
     ],
     "depends": ["account_invoice_base_invoicing_mode", "stock"],
 }
@@ -1,30 +1,105 @@
 # Copyright 2020 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
-from odoo import _, models
+from odoo import _, api, fields, models
 from odoo.tools import groupby
 
+from odoo.addons.queue_job.job import identity_exact
+
 
 class StockPicking(models.Model):
     _inherit = "stock.picking"
 
+    invoicing_at_shipping_pending = fields.Boolean(
+        copy=False,
+        readonly=True,
+        index=True,
+        help="Technical field: the picking is done and waits for the job "
+        "invoicing its partner at shipping.",
+    )
+
     def _action_done(self):
         res = super()._action_done()
-        for picking in self:
-            if picking._invoice_at_shipping():
-                picking.with_delay()._invoicing_at_shipping()
+        pickings = self._filter_invoice_at_shipping()
+        if pickings:
+            pickings.write({"invoicing_at_shipping_pending": True})
+            pickings._enqueue_invoicing_at_shipping()
         return res
 
+    def _get_invoicing_at_shipping_delay(self):
+        """Number of seconds to wait before invoicing at shipping, so the
+        pickings of the same partner done meanwhile are invoiced together.
+        """
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("account_invoice_mode_at_shipping.delay", 10)
+        )
+
+    def _enqueue_invoicing_at_shipping(self):
+        """Enqueue one job by invoicing partner of the pickings.
+
+        A partner having already a job waiting to be run does not get a new
+        one: the waiting job invoices the new pickings as well.
+        """
+        delay = self._get_invoicing_at_shipping_delay()
+        for partner in self.sale_id.partner_invoice_id:
+            self.browse().with_delay(
+                eta=delay or None,
+                identity_key=identity_exact,
+                description=_("Invoice at shipping %s") % partner.display_name,
+            )._invoicing_at_shipping_by_partner(partner.id)
+
+    @api.model
+    def _cron_invoicing_at_shipping_pending(self):
+        """Enqueue the invoicing of the pickings still waiting for it.
+
+        A picking flagged by a transaction committing after the job of its
+        partner searched the pending pickings is not invoiced by this job:
+        the flag is only visible once committed. The pickings are swept
+        here so their invoicing doesn't depend on when the jobs run.
+        """
+        pickings = self.search([("invoicing_at_shipping_pending", "=", True)])
+        pickings._enqueue_invoicing_at_shipping()
+
+    @api.model
+    def _invoicing_at_shipping_by_partner(self, partner_id):
+        """Invoice the pickings of the invoicing partner done since its last
+        invoicing at shipping.
+        """
+        pickings = self.search(
+            [
+                ("invoicing_at_shipping_pending", "=", True),
+                ("sale_id.partner_invoice_id", "=", partner_id),
+            ]
+        )
+        if not pickings:
+            return _("Nothing to invoice.")
+        pickings.write({"invoicing_at_shipping_pending": False})
+        return pickings._invoicing_at_shipping()
+
     def _invoice_at_shipping(self):
         """Check if picking must be invoiced at shipping."""
         self.ensure_one()
-        return (
-            self.picking_type_code == "outgoing"
-            and self.sale_id.partner_invoice_id.invoicing_mode == "at_shipping"
+        return bool(self._filter_invoice_at_shipping())
+
+    def _filter_invoice_at_shipping(self):
+        """Get the pickings which must be invoiced at shipping, checked for
+        all of them in one query.
+
+        :return: stock.picking recordset
+        """
+        if not self:
+            return self
+        return self.search(
+            [
+                ("id", "in", self.ids),
+                ("picking_type_code", "=", "outgoing"),
+                ("sale_id.partner_invoice_id.invoicing_mode", "=", "at_shipping"),
+            ]
         )
 
     def _invoicing_at_shipping(self):
-        self.ensure_one()
         SALE = self.env["sale.order"]
         sales = SALE.browse()
         # Filter out non invoicable sales order
@@ -40,6 +115,12 @@ class StockPicking(models.Model):
         return self.env["account.move"].browse(invoice_ids) or _("Nothing to invoice.")
 
     def _get_sales_order_to_invoice(self):
-        return self.mapped("move_lines.sale_line_id.order_id").filtered(
-            lambda r: r._get_invoiceable_lines()
-        )
+        """Get the sale orders of the pickings having lines to invoice.
+
+        The invoiceable lines of all the orders are computed at once. A
+        section is only invoiceable with the lines following it, which may
+        belong to the next order: sections are ignored.
+        """
+        sales = self.mapped("move_lines.sale_line_id.order_id")
+        lines = sales._get_invoiceable_lines()
+        return lines.filtered(lambda line: line.display_type != "line_section").order_id
@@ -1,6 +1,8 @@
 # Copyright 2020 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+from unittest import mock
+
 from odoo.tests import tagged
 from odoo.tests.common import SavepointCase
 
@@ -78,3 +80,78 @@ class TestInvoiceModeAtShipping(SavepointCase):
             picking.action_assign()
             picking.button_validate()
         self.assertEqual(len(self.so1.invoice_ids), 0)
+
+    def test_invoice_at_shipping_coalesced_by_partner(self):
+        """Check that pickings of the same partner are invoiced by one job."""
+        self.partner.invoicing_mode = "at_shipping"
+        so2 = self.so1.copy()
+        sales = self.so1 | so2
+        sales.action_confirm()
+        pickings = sales.picking_ids
+        for line in pickings.move_lines:
+            line.quantity_done = line.product_uom_qty
+        jobs_before = self.env["queue.job"].search([])
+        pickings._action_done()
+        self.assertTrue(all(pickings.mapped("invoicing_at_shipping_pending")))
+        job = self.env["queue.job"].search([]) - jobs_before
+        self.assertEqual(len(job), 1)
+        self.assertEqual(job.method_name, "_invoicing_at_shipping_by_partner")
+        self.assertEqual(job.args, [self.partner.id])
+        # A picking done while the job waits does not get a new job
+        pickings[0]._enqueue_invoicing_at_shipping()
+        self.assertEqual(self.env["queue.job"].search([]) - jobs_before, job)
+        invoices = self.env["stock.picking"]._invoicing_at_shipping_by_partner(
+            self.partner.id
+        )
+        self.assertEqual(len(invoices), 1)
+        self.assertEqual(invoices, sales.invoice_ids)
+        self.assertFalse(any(pickings.mapped("invoicing_at_shipping_pending")))
+
+    def test_invoice_at_shipping_pending_after_job(self):
+        """Check that a picking flagged once the job of its partner ran is
+        invoiced through the scheduled action.
+        """
+        self.partner.invoicing_mode = "at_shipping"
+        self.so1.action_confirm()
+        picking = self.so1.picking_ids
+        for line in picking.move_lines:
+            line.quantity_done = line.product_uom_qty
+        # The job of the partner ran before the picking flag was committed:
+        # the picking is flagged but no job is waiting any more
+        with mock.patch.object(
+            type(picking), "_enqueue_invoicing_at_shipping", autospec=True
+        ):
+            picking._action_done()
+        self.assertTrue(picking.invoicing_at_shipping_pending)
+        jobs_before = self.env["queue.job"].search([])
+        self.env["stock.picking"]._cron_invoicing_at_shipping_pending()
+        job = self.env["queue.job"].search([]) - jobs_before
+        self.assertEqual(len(job), 1)
+        self.assertEqual(job.method_name, "_invoicing_at_shipping_by_partner")
+        self.assertEqual(job.args, [self.partner.id])
+        # Sweeping again while the job waits does not enqueue another one
+        self.env["stock.picking"]._cron_invoicing_at_shipping_pending()
+        self.assertEqual(self.env["queue.job"].search([]) - jobs_before, job)
+        invoices = self.env["stock.picking"]._invoicing_at_shipping_by_partner(
+            self.partner.id
+        )
+        self.assertEqual(invoices, self.so1.invoice_ids)
+        self.assertFalse(picking.invoicing_at_shipping_pending)
+
+    def test_get_sales_order_to_invoice(self):
+        """Check that only the orders with lines to invoice are returned."""
+        self.partner.invoicing_mode = "at_shipping"
+        self.product.invoice_policy = "delivery"
+        so2 = self.so1.copy()
+        sales = self.so1 | so2
+        sales.action_confirm()
+        pickings = sales.picking_ids
+        self.assertEqual(pickings._filter_invoice_at_shipping(), pickings)
+        self.assertFalse(pickings._get_sales_order_to_invoice())
+        picking = so2.picking_ids
+        for line in picking.move_lines:
+            line.quantity_done = line.product_uom_qty
+        picking._action_done()
+        self.assertEqual(pickings._get_sales_order_to_invoice(), so2)
+        self.partner.invoicing_mode = "standard"
+        self.assertFalse(pickings._filter_invoice_at_shipping())
@@ -11,3 +11,14 @@ class ResCompany(models.Model):
         string="Default Sales Invoicing Grouping Criteria",
         comodel_name="sale.invoicing.grouping.criteria",
     )
+    sale_invoicing_max_orders = fields.Integer(
+        string="Maximum Orders per Invoice",
+        help="Orders of the same grouping key are split into several invoices "
+        "of at most this number of orders. 0 for no limit.",
+    )
+    sale_invoicing_max_lines = fields.Integer(
+        string="Maximum Order Lines per Invoice",
+        help="Orders of the same grouping key are split into several invoices "
+        "of at most this number of order lines (unless a single order has "
+        "more). 0 for no limit.",
+    )
@@ -10,3 +10,9 @@ class ResConfigSettings(models.TransientModel):
     res_default_sale_invoicing_grouping_criteria_id = fields.Many2one(
         related="company_id.default_sale_invoicing_grouping_criteria_id", readonly=False
     )
+    res_sale_invoicing_max_orders = fields.Integer(
+        related="company_id.sale_invoicing_max_orders", readonly=False
+    )
+    res_sale_invoicing_max_lines = fields.Integer(
+        related="company_id.sale_invoicing_max_lines", readonly=False
+    )
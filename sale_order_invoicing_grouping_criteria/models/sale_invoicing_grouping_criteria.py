@@ -16,3 +16,11 @@ class SaleInvoicingGroupingCriteria(models.Model):
         help="Fields used for grouping sales orders when invoicing. "
         "Invoicing address, company and currency will always be applied.",
     )
+
+    def _get_grouping_field_names(self):
+        """Get the names of the sale order fields used for grouping.
+
+        :return: list of str
+        """
+        self.ensure_one()
+        return self.field_ids.mapped("name")
@@ -18,34 +18,147 @@ class SaleOrder(models.Model):
         return self.partner_invoice_id or self.partner_id
 
     def _get_sale_invoicing_group_key(self):
-        """Prepare extended grouping criteria for sales orders."""
+        """Prepare extended grouping criteria for sales orders.
+
+        Prefer overriding _get_sale_invoicing_group_keys, which prepares them
+        for all the orders at once. An override of this method is still used,
+        order by order.
+        """
         self.ensure_one()
-        group_key = [
-            self.company_id.id,
-            self.partner_invoice_id.id,
-            self.currency_id.id,
-        ]
-        partner = self._get_grouping_partner()
-        criteria = (
-            partner.sale_invoicing_grouping_criteria_id
-            or self.company_id.default_sale_invoicing_grouping_criteria_id
+        return self._read_sale_invoicing_group_keys()[self.id]
+
+    def _is_sale_invoicing_group_key_overridden(self):
+        """Check if _get_sale_invoicing_group_key is overridden by another
+        module, in which case the keys are prepared order by order.
+
+        :return: bool
+        """
+        return (
+            type(self)._get_sale_invoicing_group_key
+            is not SaleOrder._get_sale_invoicing_group_key
+        )
+
+    def _get_sale_invoicing_criteria(self):
+        """Get the grouping criteria of each order.
+
+        :return: dict of order id: sale.invoicing.grouping.criteria recordset
+        """
+        return {
+            order.id: (
+                order._get_grouping_partner().sale_invoicing_grouping_criteria_id
+                or order.company_id.default_sale_invoicing_grouping_criteria_id
+            )
+            for order in self
+        }
+
+    def _get_sale_invoicing_group_keys(self):
+        """Prepare the extended grouping criteria of all the orders at once.
+        This is the method to override to change the grouping of the orders.
+
+        :return: dict of order id: tuple
+        """
+        if self._is_sale_invoicing_group_key_overridden():
+            return {order.id: order._get_sale_invoicing_group_key() for order in self}
+        return self._read_sale_invoicing_group_keys()
+
+    def _read_sale_invoicing_group_keys(self):
+        """Read the extended grouping criteria of all the orders at once.
+
+        Each criteria is compiled once into its list of field names, and the
+        values of all these fields are read for all the orders together.
+
+        :return: dict of order id: tuple
+        """
+        criteria_by_order = self._get_sale_invoicing_criteria()
+        field_names_by_criteria = {
+            criteria: criteria._get_grouping_field_names()
+            for criteria in set(criteria_by_order.values())
+            if criteria
+        }
+        field_names = {
+            field_name
+            for criteria_field_names in field_names_by_criteria.values()
+            for field_name in criteria_field_names
+        }
+        values_by_order = {}
+        if field_names:
+            for values in self.read(list(field_names), load="_classic_write"):
+                values_by_order[values["id"]] = {
+                    field_name: (
+                        tuple(sorted(value)) if isinstance(value, list) else value
+                    )
+                    for field_name, value in values.items()
+                }
+        group_keys = {}
+        for order in self:
+            criteria = criteria_by_order[order.id]
+            values = values_by_order.get(order.id, {})
+            group_keys[order.id] = (
+                order.company_id.id,
+                order.partner_invoice_id.id,
+                order.currency_id.id,
+            ) + tuple(
+                values[field_name]
+                for field_name in field_names_by_criteria.get(criteria, [])
+            )
+        return group_keys
+
+    def _split_sale_invoicing_group(self, order_ids, line_counts):
+        """Split the orders of a grouping key into sub-batches bounded by the
+        maximum number of orders and lines per invoice of their company.
+
+        :param order_ids: list of sale order ids
+        :param line_counts: dict of order id: number of lines
+        :return: list of list of sale order ids
+        """
+        company = self.browse(order_ids[0]).company_id
+        max_orders = company.sale_invoicing_max_orders
+        max_lines = company.sale_invoicing_max_lines
+        if not max_orders and not max_lines:
+            return [order_ids]
+        batches = []
+        batch = []
+        batch_lines = 0
+        for order_id in order_ids:
+            order_lines = line_counts.get(order_id, 0)
+            if batch and (
+                (max_orders and len(batch) >= max_orders)
+                or (max_lines and batch_lines + order_lines > max_lines)
+            ):
+                batches.append(batch)
+                batch = []
+                batch_lines = 0
+            batch.append(order_id)
+            batch_lines += order_lines
+        batches.append(batch)
+        return batches
+
+    def _get_sale_invoicing_line_counts(self):
+        """Get the number of lines of the orders, if needed to split them.
+
+        :return: dict of order id: number of lines
+        """
+        if not any(self.company_id.mapped("sale_invoicing_max_lines")):
+            return {}
+        data = self.env["sale.order.line"].read_group(
+            [("order_id", "in", self.ids)], ["order_id"], ["order_id"]
         )
-        for field in criteria.field_ids:
-            group_key.append(self[field.name])
-        return tuple(group_key)
+        return {group["order_id"][0]: group["order_id_count"] for group in data}
 
     def _create_invoices(self, grouped=False, final=False, date=None):
-        """Slice the batch according grouping criteria."""
+        """Slice the batch according grouping criteria, and each group in
+        sub-batches of bounded size, each one creating its own invoices."""
+        group_keys = self._get_sale_invoicing_group_keys()
         order_groups = {}
         for order in self:
-            group_key = order._get_sale_invoicing_group_key()
-            if group_key not in order_groups:
-                order_groups[group_key] = order
-            else:
-                order_groups[group_key] += order
+            order_groups.setdefault(group_keys[order.id], []).append(order.id)
+        line_counts = self._get_sale_invoicing_line_counts()
         moves = self.env["account.move"]
-        for group in order_groups.values():
-            moves += super(SaleOrder, group)._create_invoices(
-                grouped=grouped, final=final, date=date
-            )
+        for group_order_ids in order_groups.values():
+            for order_ids in self._split_sale_invoicing_group(
+                group_order_ids, line_counts
+            ):
+                moves += super(SaleOrder, self.browse(order_ids))._create_invoices(
+                    grouped=grouped, final=final, date=date
+                )
         return moves
@@ -1,6 +1,8 @@
 # Copyright 2019 Tecnativa - Pedro M. Baeza
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+from unittest import mock
+
 from odoo.tests import SavepointCase
 
 
@@ -92,3 +94,74 @@ class TestSaleOrderInvoicingGroupingCriteria(SavepointCase):
         self.assertEqual(
             children.sale_invoicing_grouping_criteria_id, self.grouping_criteria
         )
+
+    def test_sale_invoicing_group_keys(self):
+        self.order2.partner_shipping_id = self.partner2.id
+        orders = self.order + self.order2
+        keys = orders._get_sale_invoicing_group_keys()
+        self.assertEqual(keys[self.order.id], keys[self.order2.id])
+        self.partner.sale_invoicing_grouping_criteria_id = self.grouping_criteria.id
+        keys = orders._get_sale_invoicing_group_keys()
+        self.assertNotEqual(keys[self.order.id], keys[self.order2.id])
+        self.assertEqual(
+            keys[self.order.id], self.order._get_sale_invoicing_group_key()
+        )
+
+    def test_sale_invoicing_group_key_override(self):
+        """An override of the key of one order is used by the batch."""
+        orders = self.order + self.order2
+        order_class = type(self.order)
+        get_group_key = order_class._get_sale_invoicing_group_key
+
+        def _get_sale_invoicing_group_key(order):
+            return get_group_key(order) + (order.id,)
+
+        with mock.patch.object(
+            order_class,
+            "_get_sale_invoicing_group_key",
+            autospec=True,
+            side_effect=_get_sale_invoicing_group_key,
+        ) as get_group_key_mock:
+            invoices = orders._create_invoices()
+        self.assertEqual(get_group_key_mock.call_count, 2)
+        self.assertEqual(len(invoices), 2)
+        self.assertNotEqual(self.order.invoice_ids, self.order2.invoice_ids)
+
+    def _count_group_keys_queries(self, orders):
+        self.env["base"].flush()
+        orders.invalidate_cache()
+        queries = self.cr.sql_log_count
+        orders._get_sale_invoicing_group_keys()
+        return self.cr.sql_log_count - queries
+
+    def test_sale_invoicing_group_keys_queries(self):
+        """The number of queries doesn't depend on the number of orders."""
+        self.partner.sale_invoicing_grouping_criteria_id = self.grouping_criteria.id
+        orders = self.order + self.order2
+        more_orders = orders
+        for _i in range(10):
+            more_orders += self.order.copy({"partner_shipping_id": self.partner2.id})
+        self.assertEqual(
+            self._count_group_keys_queries(orders),
+            self._count_group_keys_queries(more_orders),
+        )
+
+    def test_invoicing_max_orders(self):
+        order3 = self.order.copy()
+        order3.action_confirm()
+        self.order.company_id.sale_invoicing_max_orders = 2
+        invoices = (self.order + self.order2 + order3)._create_invoices()
+        self.assertEqual(len(invoices), 2)
+        self.assertEqual(self.order.invoice_ids, self.order2.invoice_ids)
+        self.assertNotEqual(self.order.invoice_ids, order3.invoice_ids)
+
+    def test_invoicing_max_lines(self):
+        self.order.order_line.copy({"order_id": self.order.id})
+        order3 = self.order2.copy()
+        order3.action_confirm()
+        self.order.company_id.sale_invoicing_max_lines = 2
+        invoices = (self.order + self.order2 + order3)._create_invoices()
+        # The first order has 2 lines, the 2 other ones 1 line
+        self.assertEqual(len(invoices), 2)
+        self.assertNotEqual(self.order.invoice_ids, self.order2.invoice_ids)
+        self.assertEqual(self.order2.invoice_ids, order3.invoice_ids)
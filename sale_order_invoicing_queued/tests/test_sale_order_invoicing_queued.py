@@ -69,3 +69,23 @@ class TestSaleOrderInvoicingQueue(SavepointCase):
         # Execute method directly for checking if invoicing is done
         self.order.create_invoices_job(True)
         self.assertTrue(self.order.invoice_ids)
+
+    def test_queue_invoicing_grouped(self):
+        order3 = self.order.copy()
+        order3.action_confirm()
+        orders = self.order + self.order2 + order3
+        wizard = self.wizard_obj.with_context(
+            active_ids=orders.ids, active_model=self.order._name
+        ).create({})
+        prev_jobs = self.queue_obj.search([])
+        wizard.enqueue_invoices()
+        jobs = self.queue_obj.search([]) - prev_jobs
+        self.assertEqual(len(jobs), 2)
+        # Orders of the same partner are invoiced by the same job
+        self.assertEqual(len(self.order.invoicing_job_ids), 1)
+        self.assertEqual(self.order.invoicing_job_ids, order3.invoicing_job_ids)
+        self.assertEqual(orders.mapped("invoicing_job_ids"), jobs)
+        self.assertEqual(
+            sorted(self.order.invoicing_job_ids.record_ids),
+            sorted((self.order + order3).ids),
+        )
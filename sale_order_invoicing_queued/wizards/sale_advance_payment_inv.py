@@ -3,14 +3,101 @@
 
 from collections import defaultdict
 
+from psycopg2 import sql
+
 from odoo import _, exceptions, models
 
 
 class SaleAdvancePaymentInv(models.TransientModel):
     _inherit = "sale.advance.payment.inv"
 
+    def _get_orders_group_keys(self, sale_orders):
+        """Get the key of the invoice of each order.
+
+        :param sale_orders: sale.order recordset
+        :return: dict of order id: tuple
+        """
+        # If we have `sale_order_invoicing_grouping_criteria` module
+        # installed, we take that grouping criteria: its batch method still
+        # calls the per-order `_get_sale_invoicing_group_key` when overridden
+        if hasattr(sale_orders, "_get_sale_invoicing_group_keys"):
+            return sale_orders._get_sale_invoicing_group_keys()
+        # HACK: This is not exactly doing the same as upstream, as we
+        # apply fields over order, not invoice vals, but serves for
+        # standard case and most of the transferred fields mapping them.
+        # This is done this way for not needing to build 2 times the
+        # same vals dictionary.
+        field_mapping = {"partner_id": "partner_invoice_id"}
+        grouping_keys = sale_orders._get_invoice_grouping_keys()
+        return {
+            order.id: tuple(
+                [
+                    order[field_mapping.get(grouping_key, grouping_key)]
+                    for grouping_key in grouping_keys
+                ]
+            )
+            for order in sale_orders
+        }
+
+    def _check_orders_enqueued(self, sale_orders):
+        """Check in one query that no order is already being invoiced by a job.
+
+        :param sale_orders: sale.order recordset
+        """
+        enqueued_orders = sale_orders.sudo().search(
+            [
+                ("id", "in", sale_orders.ids),
+                (
+                    "invoicing_job_ids.state",
+                    "in",
+                    ["pending", "enqueued", "started"],
+                ),
+            ]
+        )
+        if enqueued_orders:
+            raise exceptions.UserError(
+                _(
+                    "There's already an enqueued job for invoicing the sales "
+                    "order %s. Please wait until it's finished or remove it "
+                    "from the selection."
+                )
+                % (", ".join(enqueued_orders.mapped("name")),)
+            )
+
+    def _link_orders_jobs(self, job_order_ids):
+        """Link the orders to the jobs invoicing them, with one query.
+
+        :param job_order_ids: dict of job uuid: list of sale order ids
+        """
+        jobs = (
+            self.env["queue.job"]
+            .sudo()
+            .search_read([("uuid", "in", list(job_order_ids))], ["uuid"])
+        )
+        order_ids = []
+        job_ids = []
+        for job in jobs:
+            for order_id in job_order_ids[job["uuid"]]:
+                order_ids.append(order_id)
+                job_ids.append(job["id"])
+        if not order_ids:
+            return
+        field = self.env["sale.order"]._fields["invoicing_job_ids"]
+        self.env.cr.execute(
+            sql.SQL(
+                "INSERT INTO {table} ({order_column}, {job_column}) "
+                "SELECT unnest(%s::int[]), unnest(%s::int[]) "
+                "ON CONFLICT DO NOTHING"
+            ).format(
+                table=sql.Identifier(field.relation),
+                order_column=sql.Identifier(field.column1),
+                job_column=sql.Identifier(field.column2),
+            ),
+            (order_ids, job_ids),
+        )
+        self.env["sale.order"].browse(order_ids).invalidate_cache(["invoicing_job_ids"])
+
     def enqueue_invoices(self):
-        queue_obj = self.env["queue.job"]
         order_obj = self.env["sale.order"]
         context = self.env.context
         final = self.advance_payment_method == "all"
@@ -18,38 +105,15 @@ class SaleAdvancePaymentInv(models.TransientModel):
             # Call standard method in these cases
             return self.create_invoices()
         sale_orders = order_obj.browse(context.get("active_ids", []))
-        grouped_orders = defaultdict(lambda: order_obj.browse())
+        self._check_orders_enqueued(sale_orders)
+        group_keys = self._get_orders_group_keys(sale_orders)
+        grouped_order_ids = defaultdict(list)
         for order in sale_orders:
-            # If we have `sale_order_invoicing_grouping_criteria` module
-            # installed, we take that grouping criteria
-            if hasattr(order, "_get_sale_invoicing_group_key"):
-                group_key = order._get_sale_invoicing_group_key()
-            else:
-                # HACK: This is not exactly doing the same as upstream, as we
-                # apply fields over order, not invoice vals, but serves for
-                # standard case and most of the transferred fields mapping them.
-                # This is done this way for not needing to build 2 times the
-                # same vals dictionary.
-                field_mapping = {"partner_id": "partner_invoice_id"}
-                group_key = tuple(
-                    [
-                        order[field_mapping.get(grouping_key, grouping_key)]
-                        for grouping_key in order._get_invoice_grouping_keys()
-                    ]
-                )
-            if order.invoicing_job_ids.filtered(
-                lambda x: x.state in {"pending", "enqueued", "started"}
-            ):
-                raise exceptions.UserError(
-                    _(
-                        "There's already an enqueued job for invoicing the sales "
-                        "order %s. Please wait until it's finished or remove it "
-                        "from the selection."
-                    )
-                    % (order.name,)
-                )
-            grouped_orders[group_key] |= order
-        for orders in grouped_orders.values():
-            new_delay = orders.with_delay().create_invoices_job(final)
-            job = queue_obj.search([("uuid", "=", new_delay.uuid)])
-            orders.sudo().write({"invoicing_job_ids": [(4, job.id)]})
+            grouped_order_ids[group_keys[order.id]].append(order.id)
+        job_order_ids = {}
+        for order_ids in grouped_order_ids.values():
+            new_delay = (
+                order_obj.browse(order_ids).with_delay().create_invoices_job(final)
+            )
+            job_order_ids[new_delay.uuid] = order_ids
+        self._link_orders_jobs(job_order_ids)
@@ -26,6 +26,7 @@ setuptools.setup(
         'odoo14-addon-account_invoice_line_sequence',
         'odoo14-addon-account_invoice_mass_sending',
         'odoo14-addon-account_invoice_merge',
+        'odoo14-addon-account_invoice_merge_queued',
         'odoo14-addon-account_invoice_mode_at_shipping',
         'odoo14-addon-account_invoice_mode_daily',
         'odoo14-addon-account_invoice_mode_monthly',
@@ -82,6 +83,7 @@ setuptools.setup(
         'odoo14-addon-sale_timesheet_invoice_description',
         'odoo14-addon-stock_picking_invoicing',
         'odoo14-addon-stock_picking_invoicing_incoterm',
+        'odoo14-addon-stock_picking_invoicing_queued',
     ],
     classifiers=[
         'Programming Language :: Python',
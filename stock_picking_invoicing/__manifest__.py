@@ -10,6 +10,7 @@
     "depends": ["stock", "account", "stock_picking_invoice_link"],
     "data": [
         "security/ir.model.access.csv",
+        "data/ir_cron.xml",
         "wizards/stock_invoice_onshipping_view.xml",
         "wizards/stock_return_picking_view.xml",
         "views/stock_move.xml",
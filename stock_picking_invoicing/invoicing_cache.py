@@ -0,0 +1,44 @@
+# Copyright (C) 2019-Today: Odoo Community Association (OCA)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+# Context key used to share the cache during an invoicing run
+INVOICING_CACHE_KEY = "picking_invoicing_cache"
+
+
+class InvoicingCache(object):
+    """
+    Memoize values computed while invoicing pickings.
+    An instance lives for a single run of the invoicing wizard; values are
+    stored by namespace and by key (a tuple of ids). Hits and misses are
+    counted by namespace in stats.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self.stats = {}
+
+    def get(self, namespace, key, compute):
+        """
+        Get the value stored for the given key, compute it if missing
+        :param namespace: str
+        :param key: hashable
+        :param compute: function without argument returning the value
+        :return: the cached value
+        """
+        data = self._data.setdefault(namespace, {})
+        stats = self.stats.setdefault(namespace, {"hits": 0, "misses": 0})
+        if key in data:
+            stats["hits"] += 1
+        else:
+            stats["misses"] += 1
+            data[key] = compute()
+        return data[key]
+
+    def set(self, namespace, key, value):
+        """
+        Store the value of the given key
+        :param namespace: str
+        :param key: hashable
+        :param value: the value to cache
+        """
+        self._data.setdefault(namespace, {})[key] = value
@@ -7,6 +7,21 @@ from odoo import models
 class AccountInvoice(models.Model):
     _inherit = "account.move"
 
+    def _update_pickings_invoice_state(self, invoice_state):
+        """
+        Update the invoice state of the pickings of current invoices (only
+        for invoices, not refunds) and of the moves of their lines, each
+        picking and move being updated once
+        :param invoice_state: str
+        :return: stock.picking recordset (where the update has been executed)
+        """
+        pickings = self.filtered(
+            lambda i: i.picking_ids and i.move_type in ["out_invoice", "in_invoice"]
+        ).mapped("picking_ids")
+        return pickings._update_invoice_state_with_moves(
+            invoice_state, moves=self.mapped("invoice_line_ids.move_line_ids")
+        )
+
     def button_cancel(self):
         """
         Inherit to update related picking as '2binvoiced' when the invoice is
@@ -14,20 +29,12 @@ class AccountInvoice(models.Model):
         :return: bool
         """
         result = super().button_cancel()
-        pickings = self.filtered(
-            lambda i: i.picking_ids and i.move_type in ["out_invoice", "in_invoice"]
-        ).mapped("picking_ids")
-        self.mapped("invoice_line_ids.move_line_ids")._set_as_2binvoiced()
-        pickings._set_as_2binvoiced()
+        self._update_pickings_invoice_state("2binvoiced")
         return result
 
     def button_draft(self):
         result = super().button_draft()
-        pickings = self.filtered(
-            lambda i: i.picking_ids and i.move_type in ["out_invoice", "in_invoice"]
-        ).mapped("picking_ids")
-        self.mapped("invoice_line_ids.move_line_ids")._set_as_invoiced()
-        pickings._set_as_invoiced()
+        self._update_pickings_invoice_state("invoiced")
         return result
 
     def unlink(self):
@@ -36,9 +43,5 @@ class AccountInvoice(models.Model):
         (only for invoices, not refunds)
         :return:
         """
-        pickings = self.filtered(
-            lambda i: i.picking_ids and i.move_type in ["out_invoice", "in_invoice"]
-        ).mapped("picking_ids")
-        self.mapped("invoice_line_ids.move_line_ids")._set_as_2binvoiced()
-        pickings._set_as_2binvoiced()
+        self._update_pickings_invoice_state("2binvoiced")
         return super().unlink()
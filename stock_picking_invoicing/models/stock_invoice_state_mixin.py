@@ -1,7 +1,9 @@
 # Copyright (C) 2019-Today: Odoo Community Association (OCA)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+from psycopg2 import sql
+
+from odoo import api, fields, models
 
 
 class StockInvoiceStateMixin(models.AbstractModel):
@@ -53,7 +55,46 @@ class StockInvoiceStateMixin(models.AbstractModel):
         :param invoice_state: str
         :return: self recordset (where the updated has been executed)
         """
-        records = self.filtered(lambda r: r.invoice_state != invoice_state)
+        if not self:
+            return self
+        self.check_access_rights("write")
+        self.check_access_rule("write")
+        return self._write_invoice_state(
+            invoice_state, sql.SQL("id IN %s"), (tuple(self.ids),)
+        )
+
+    @api.model
+    def _write_invoice_state(self, invoice_state, where_clause, where_params):
+        """
+        Update invoice_state of the records matching the given condition
+        (and not already in this state) with a single query, then invalidate
+        the cache and trigger the recomputation of dependent fields.
+        The update intentionally bypasses write(): overrides of write() are
+        not called on invoice state transitions, inherit _update_invoice_state
+        (or _set_as_*) to react to them.
+        :param invoice_state: str
+        :param where_clause: psycopg2.sql.Composable
+        :param where_params: tuple
+        :return: recordset where the update has been executed
+        """
+        self.flush(["invoice_state"])
+        query = sql.SQL(
+            """
+            UPDATE {table}
+            SET invoice_state = %s,
+                write_uid = %s,
+                write_date = (now() at time zone 'UTC')
+            WHERE {where} AND invoice_state IS DISTINCT FROM %s
+            RETURNING id
+            """
+        ).format(table=sql.Identifier(self._table), where=where_clause)
+        self.env.cr.execute(
+            query, (invoice_state, self.env.uid) + where_params + (invoice_state,)
+        )
+        records = self.browse([row[0] for row in self.env.cr.fetchall()])
         if records:
-            records.write({"invoice_state": invoice_state})
+            records.invalidate_cache(
+                ["invoice_state", "write_uid", "write_date"], records.ids
+            )
+            records.modified(["invoice_state"])
         return records
@@ -3,6 +3,8 @@
 
 from odoo import api, fields, models
 
+from ..invoicing_cache import INVOICING_CACHE_KEY
+
 
 class StockMove(models.Model):
     _name = "stock.move"
@@ -13,18 +15,40 @@ class StockMove(models.Model):
 
     def _get_taxes(self, fiscal_position, inv_type):
         """
-        Map product taxes based on given fiscal position
+        Map product taxes based on given fiscal position.
+        During an invoicing run, the mapping is done once per product,
+        fiscal position, invoice type and company.
         :param fiscal_position: account.fiscal.position recordset
         :param inv_type: string
         :return: account.tax recordset
         """
         product = self.mapped("product_id")
         product.ensure_one()
+        company_id = self.env.context.get("force_company", self.env.company.id)
+        cache = self.env.context.get(INVOICING_CACHE_KEY)
+        if cache is None:
+            return self._map_taxes(product, fiscal_position, inv_type, company_id)
+        tax_ids = cache.get(
+            "taxes",
+            (product.id, fiscal_position.id, inv_type, company_id),
+            lambda: self._map_taxes(product, fiscal_position, inv_type, company_id).ids,
+        )
+        return self.env["account.tax"].browse(tax_ids)
+
+    @api.model
+    def _map_taxes(self, product, fiscal_position, inv_type, company_id):
+        """
+        Map taxes of given product based on given fiscal position
+        :param product: product.product recordset
+        :param fiscal_position: account.fiscal.position recordset
+        :param inv_type: string
+        :param company_id: int
+        :return: account.tax recordset
+        """
         if inv_type in ("out_invoice", "out_refund"):
             taxes = product.taxes_id
         else:
             taxes = product.supplier_taxes_id
-        company_id = self.env.context.get("force_company", self.env.company.id)
         my_taxes = taxes.filtered(lambda r: r.company_id.id == company_id)
         return fiscal_position.map_tax(my_taxes)
 
@@ -46,23 +70,64 @@ class StockMove(models.Model):
         :param qty: float
         :return: float
         """
-        product = self.mapped("product_id")
-        product.ensure_one()
-        if inv_type in ("in_invoice", "in_refund"):
-            result = product.price
-        else:
+        return self._get_price_unit_invoice_batch(inv_type, [(self, qty, partner)])[0]
+
+    @api.model
+    def _get_price_unit_invoice_batch(self, inv_type, moves_qty_partner):
+        """
+        Gets price unit for many invoice lines at once: prices are computed
+        with one pricelist evaluation per partner pricelist and uom
+        :param inv_type: str
+        :param moves_qty_partner: list of tuple (stock.move recordset of a
+            single product, qty, res.partner)
+        :return: list of float (same order as moves_qty_partner)
+        """
+        products = []
+        pricelist_groups = {}
+        for index, (moves, _qty, partner) in enumerate(moves_qty_partner):
+            product = moves.mapped("product_id")
+            product.ensure_one()
+            products.append(product)
+            if inv_type in ("in_invoice", "in_refund"):
+                continue
             # If partner given, search price in its sale pricelist
             if partner and partner.property_product_pricelist:
-                product = product.with_context(
-                    partner=partner.id,
-                    quantity=qty,
-                    pricelist=partner.property_product_pricelist.id,
-                    uom=fields.first(self).product_uom.id,
+                key = (
+                    partner.property_product_pricelist,
+                    fields.first(moves).product_uom,
+                )
+                pricelist_groups.setdefault(key, []).append(index)
+        # Iterate on a single recordset to compute the prices of all the
+        # products at once
+        all_products = self.env["product.product"].union(*products)
+        if inv_type in ("in_invoice", "in_refund"):
+            product_prices = {p.id: p.price for p in all_products}
+        else:
+            product_prices = {p.id: p.lst_price for p in all_products}
+        prices = [product_prices[product.id] for product in products]
+        for (pricelist, uom), indexes in pricelist_groups.items():
+            # The pricelist returns one price per product: a product priced
+            # many times (for different quantities/partners) is dispatched
+            # in several evaluations.
+            batches = []
+            for index in indexes:
+                product = products[index]
+                for batch in batches:
+                    if product not in batch:
+                        batch[product] = index
+                        break
+                else:
+                    batches.append({product: index})
+            for batch in batches:
+                pricelist_prices = pricelist.get_products_price(
+                    list(batch),
+                    [moves_qty_partner[index][1] for index in batch.values()],
+                    [moves_qty_partner[index][2].id for index in batch.values()],
+                    uom_id=uom.id,
                 )
-                result = product.price
-            else:
-                result = product.lst_price
-        return result
+                for product, index in batch.items():
+                    prices[index] = pricelist_prices.get(product.id, 0.0)
+        return prices
 
     def _prepare_extra_move_vals(self, qty):
         """Copy invoice state for a new extra stock move"""
@@ -1,7 +1,9 @@
 # Copyright (C) 2019-Today: Odoo Community Association (OCA)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import models
+import threading
+
+from odoo import api, models
 
 
 class StockPicking(models.Model):
@@ -11,6 +13,21 @@ class StockPicking(models.Model):
         "stock.invoice.state.mixin",
     ]
 
+    def init(self):
+        """
+        Create a partial index on pickings to invoice, used to count them on
+        the inventory dashboard and to search them when invoicing
+        """
+        res = super().init()
+        self.env.cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS stock_picking_2binvoiced_index
+            ON stock_picking (picking_type_id)
+            WHERE invoice_state = '2binvoiced'
+            """
+        )
+        return res
+
     def set_to_be_invoiced(self):
         """
         Update invoice_state of current pickings to "2binvoiced".
@@ -24,16 +41,119 @@ class StockPicking(models.Model):
         Inherit to also update related moves.
         :return: bool
         """
-        self.mapped("move_lines")._set_as_2binvoiced()
-        return super()._set_as_2binvoiced()
+        return self._update_invoice_state_with_moves("2binvoiced")
 
     def _set_as_invoiced(self):
         """
         Inherit to also update related moves.
         :return: bool
         """
-        self.mapped("move_lines")._set_as_invoiced()
-        return super()._set_as_invoiced()
+        return self._update_invoice_state_with_moves("invoiced")
+
+    def _update_invoice_state_with_moves(self, invoice_state, moves=None):
+        """
+        Update invoice_state of current pickings, of their moves and of the
+        given other moves, with a single query per model. Access rights and
+        record rules are checked on pickings and moves.
+        :param invoice_state: str
+        :param moves: stock.move recordset, other moves to update
+        :return: self recordset (where the updated has been executed)
+        """
+        moves = self.mapped("move_lines") | (moves or self.env["stock.move"])
+        moves._update_invoice_state(invoice_state)
+        return self._update_invoice_state(invoice_state)
+
+    @api.model
+    def _get_pickings_to_invoice_domain(self, company):
+        """
+        Get the domain of the pickings invoiced by the scheduled action
+        :param company: res.company recordset
+        :return: list
+        """
+        return [
+            ("invoice_state", "=", "2binvoiced"),
+            ("state", "=", "done"),
+            ("company_id", "=", company.id),
+        ]
+
+    @api.model
+    def cron_invoice_pickings(
+        self, group="picking", chunk_size=500, company_id=False, batch_mode=True
+    ):
+        """
+        Invoice all the pickings to be invoiced of the company, in chunks
+        ordered by partner: the pickings of a partner are always invoiced in
+        the same chunk so they can be grouped together. The invoices of each
+        chunk are committed before invoicing the next one
+        :param group: str, grouping of the invoicing wizard
+        :param chunk_size: int, number of pickings invoiced together
+        :param company_id: int, the current company by default
+        :param batch_mode: bool, batch mode of the invoicing wizard
+        :return: account.move recordset
+        """
+        company = self.env["res.company"].browse(company_id) or self.env.company
+        self = self.with_company(company)
+        domain = self._get_pickings_to_invoice_domain(company)
+        partner_groups = self.read_group(
+            domain, ["partner_id"], ["partner_id"], orderby="partner_id"
+        )
+        invoice_ids = []
+        partner_ids = []
+        count = 0
+        for partner_group in partner_groups:
+            partner_ids.append(
+                partner_group["partner_id"] and partner_group["partner_id"][0]
+            )
+            count += partner_group["partner_id_count"]
+            if count >= chunk_size:
+                pickings = self.search(domain + [("partner_id", "in", partner_ids)])
+                invoice_ids += pickings._invoice_pickings(group, batch_mode).ids
+                self._commit_invoicing_chunk()
+                partner_ids = []
+                count = 0
+        if partner_ids:
+            pickings = self.search(domain + [("partner_id", "in", partner_ids)])
+            invoice_ids += pickings._invoice_pickings(group, batch_mode).ids
+            self._commit_invoicing_chunk()
+        return self.env["account.move"].browse(invoice_ids)
+
+    @api.model
+    def _commit_invoicing_chunk(self):
+        """
+        Commit the invoices of a chunk of pickings, so a failure only rolls
+        back the current chunk, and keep the memory bounded
+        """
+        self.flush()
+        if not getattr(threading.current_thread(), "testing", False):
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+        self.invalidate_cache()
+
+    def _invoice_pickings(self, group, batch_mode=False):
+        """
+        Invoice current pickings through the invoicing wizard. As the wizard
+        creates a single type of invoice, pickings are split by invoice type.
+        :param group: str, grouping of the invoicing wizard
+        :param batch_mode: bool, batch mode of the invoicing wizard
+        :return: account.move recordset
+        """
+        wizard_obj = self.env["stock.invoice.onshipping"]
+        pickings_by_type = {}
+        for picking in self:
+            key = (
+                picking.picking_type_code,
+                picking.location_id.usage,
+                picking.location_dest_id.usage,
+            )
+            pickings_by_type.setdefault(key, []).append(picking.id)
+        invoices = self.env["account.move"]
+        for picking_ids in pickings_by_type.values():
+            wizard = wizard_obj.with_context(
+                active_ids=picking_ids, active_model=self._name
+            ).create({"group": group, "batch_mode": batch_mode})
+            new_invoices = wizard._action_generate_invoices()
+            wizard._update_picking_invoice_status(new_invoices.mapped("picking_ids"))
+            invoices |= new_invoices
+        return invoices
 
     def _get_partner_to_invoice(self):
         self.ensure_one()
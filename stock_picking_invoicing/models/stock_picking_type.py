@@ -12,6 +12,10 @@ class PickingType(models.Model):
     count_picking_2binvoiced = fields.Integer(compute="_compute_picking_2binvoiced")
 
     def _compute_picking_2binvoiced(self):
+        """
+        Count the pickings to invoice by picking type (displayed on the
+        inventory dashboard), through the partial index on pickings to invoice
+        """
         domains = {
             "count_picking_2binvoiced": [("invoice_state", "=", "2binvoiced")],
         }
@@ -0,0 +1,231 @@
+# Copyright (C) 2019-Today: Odoo Community Association (OCA)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""
+Benchmark of the invoicing of pickings, not run with the standard tests.
+
+Run it with:
+
+    odoo -d <db> -u stock_picking_invoicing --test-tags picking_invoicing_benchmark
+
+The size of the dataset is given by the environment variables
+PICKING_INVOICING_BENCHMARK_PARTNERS, PICKING_INVOICING_BENCHMARK_PICKINGS
+(by partner) and PICKING_INVOICING_BENCHMARK_MOVES (by picking).
+Results are logged as JSON lines and appended to the file given by
+PICKING_INVOICING_BENCHMARK_OUTPUT if set.
+"""
+
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+from odoo.tests import SavepointCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+ENV_PREFIX = "PICKING_INVOICING_BENCHMARK_"
+
+
+def _get_size(name, default):
+    return int(os.environ.get(ENV_PREFIX + name, default))
+
+
+@tagged("post_install", "-at_install", "-standard", "picking_invoicing_benchmark")
+class TestPickingInvoicingBenchmark(SavepointCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True))
+        cls.nb_partners = _get_size("PARTNERS", 10)
+        cls.nb_pickings = _get_size("PICKINGS", 5)
+        cls.nb_moves = _get_size("MOVES", 5)
+        cls.picking_type = cls.env.ref("stock.picking_type_out")
+        cls.stock_location = cls.env.ref("stock.stock_location_stock")
+        cls.customers_location = cls.env.ref("stock.stock_location_customers")
+        tax = cls.env["account.tax"].create(
+            {"name": "Benchmark tax 20", "type_tax_use": "sale", "amount": 20.0}
+        )
+        tax_mapped = cls.env["account.tax"].create(
+            {"name": "Benchmark tax 10", "type_tax_use": "sale", "amount": 10.0}
+        )
+        fiscal_position = cls.env["account.fiscal.position"].create(
+            {
+                "name": "Benchmark fiscal position",
+                "tax_ids": [
+                    (0, 0, {"tax_src_id": tax.id, "tax_dest_id": tax_mapped.id})
+                ],
+            }
+        )
+        cls.products = cls.env["product.product"].create(
+            [
+                {
+                    "name": "Benchmark product %s" % index,
+                    "type": "consu",
+                    "lst_price": 10.0 + index,
+                    "taxes_id": [(6, 0, tax.ids)],
+                }
+                for index in range(cls.nb_moves)
+            ]
+        )
+        pricelist = cls.env["product.pricelist"].create(
+            {
+                "name": "Benchmark pricelist",
+                "item_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "applied_on": "3_global",
+                            "compute_price": "percentage",
+                            "percent_price": 10.0,
+                        },
+                    )
+                ],
+            }
+        )
+        cls.partners = cls.env["res.partner"].create(
+            [
+                {
+                    "name": "Benchmark partner %s" % index,
+                    "type": "invoice",
+                    "property_product_pricelist": pricelist.id if index % 2 else False,
+                    "property_account_position_id": (
+                        fiscal_position.id if index % 3 else False
+                    ),
+                }
+                for index in range(cls.nb_partners)
+            ]
+        )
+        cls.pickings = cls._create_pickings()
+
+    @classmethod
+    def _create_pickings(cls):
+        """
+        Create the done pickings to invoice
+        :return: stock.picking recordset
+        """
+        pickings = cls.env["stock.picking"].create(
+            [
+                {
+                    "partner_id": partner.id,
+                    "picking_type_id": cls.picking_type.id,
+                    "location_id": cls.stock_location.id,
+                    "location_dest_id": cls.customers_location.id,
+                    "move_lines": [
+                        (
+                            0,
+                            0,
+                            {
+                                "name": product.name,
+                                "product_id": product.id,
+                                "product_uom": product.uom_id.id,
+                                "product_uom_qty": 1.0,
+                                "location_id": cls.stock_location.id,
+                                "location_dest_id": cls.customers_location.id,
+                            },
+                        )
+                        for product in cls.products
+                    ],
+                }
+                for partner in cls.partners
+                for _index in range(cls.nb_pickings)
+            ]
+        )
+        pickings.set_to_be_invoiced()
+        pickings.action_confirm()
+        for move in pickings.mapped("move_lines"):
+            move.quantity_done = move.product_uom_qty
+        pickings._action_done()
+        return pickings
+
+    def _get_wizard(self, group, batch_mode):
+        """
+        Get the invoicing wizard of all the pickings, the cache being cleared
+        :param group: str
+        :param batch_mode: bool
+        :return: stock.invoice.onshipping record
+        """
+        wizard = (
+            self.env["stock.invoice.onshipping"]
+            .with_context(active_ids=self.pickings.ids, active_model="stock.picking")
+            .create({"group": group, "batch_mode": batch_mode})
+        )
+        self.env["base"].flush()
+        self.env.invalidate_all()
+        return wizard
+
+    def _unlink_invoices(self):
+        """
+        Delete the invoices of the pickings, which sets the pickings as to be
+        invoiced again
+        :return: int, number of invoices deleted
+        """
+        invoices = self.pickings.mapped("invoice_ids")
+        invoices.unlink()
+        return len(invoices)
+
+    def _run_benchmark(self, group, batch_mode):
+        """
+        Invoice all the pickings with the given grouping mode and measure
+        the wall time, the number of SQL queries and the peak memory.
+        The peak memory is measured in a second run, as tracing the memory
+        allocations slows down the run timed.
+        :param group: str
+        :param batch_mode: bool
+        :return: dict
+        """
+        wizard = self._get_wizard(group, batch_mode)
+        queries = self.cr.sql_log_count
+        start = time.perf_counter()
+        wizard.action_generate()
+        self.env["base"].flush()
+        wall_time = time.perf_counter() - start
+        queries = self.cr.sql_log_count - queries
+        nb_invoices = self._unlink_invoices()
+        wizard = self._get_wizard(group, batch_mode)
+        tracemalloc.start()
+        try:
+            wizard.action_generate()
+            self.env["base"].flush()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self._unlink_invoices()
+        return {
+            "benchmark": "stock_picking_invoicing.action_generate",
+            "group": group,
+            "batch_mode": batch_mode,
+            "partners": self.nb_partners,
+            "pickings": len(self.pickings),
+            "moves": len(self.pickings.mapped("move_lines")),
+            "invoices": nb_invoices,
+            "wall_time": round(wall_time, 6),
+            "queries": queries,
+            "peak_memory": peak_memory,
+        }
+
+    def _report(self, results):
+        """
+        Log the results of the benchmark and append them to the output file
+        :param results: list of dict
+        """
+        lines = [json.dumps(result, sort_keys=True) for result in results]
+        for line in lines:
+            _logger.info("Picking invoicing benchmark: %s", line)
+        output = os.environ.get(ENV_PREFIX + "OUTPUT")
+        if output:
+            with open(output, "a") as output_file:
+                output_file.write("".join(line + "\n" for line in lines))
+
+    def test_benchmark_action_generate(self):
+        results = []
+        for group in ("picking", "partner", "partner_product"):
+            for batch_mode in (False, True):
+                result = self._run_benchmark(group, batch_mode)
+                self.assertTrue(result["invoices"])
+                self.assertEqual(
+                    set(self.pickings.mapped("invoice_state")), {"2binvoiced"}
+                )
+                results.append(result)
+        self._report(results)
@@ -1,9 +1,13 @@
 # Copyright (C) 2019-Today: Odoo Community Association (OCA)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from unittest import mock
+
 from odoo import exceptions
 from odoo.tests import Form, SavepointCase, tagged
 
+from ..invoicing_cache import INVOICING_CACHE_KEY, InvoicingCache
+
 
 @tagged("post_install", "-at_install")
 class TestPickingInvoicing(SavepointCase):
@@ -94,6 +98,62 @@ class TestPickingInvoicing(SavepointCase):
             }
         )
 
+    def _create_picking_done(self, partner, products, qty=1):
+        """
+        Create an outgoing picking to be invoiced, with one move per product,
+        and validate it
+        :param partner: res.partner recordset
+        :param products: product.product recordset
+        :param qty: float
+        :return: stock.picking recordset
+        """
+        picking = self.picking_model.create(
+            {
+                "partner_id": partner.id,
+                "picking_type_id": self.pick_type_out.id,
+                "location_id": self.stock_location.id,
+                "location_dest_id": self.customers_location.id,
+            }
+        )
+        for product in products:
+            new_move = self.move_model.create(
+                {
+                    "product_id": product.id,
+                    "picking_id": picking.id,
+                    "location_dest_id": self.customers_location.id,
+                    "location_id": self.stock_location.id,
+                    "name": product.name,
+                    "product_uom_qty": qty,
+                    "product_uom": product.uom_id.id,
+                }
+            )
+            new_move.onchange_product_id()
+        picking.set_to_be_invoiced()
+        picking.action_confirm()
+        picking.action_assign()
+        for move in picking.move_ids_without_package:
+            move.quantity_done = move.product_uom_qty
+        picking.button_validate()
+        return picking
+
+    def _get_invoice_wizard(self, pickings, **values):
+        """
+        Create the invoicing wizard for given pickings
+        :param pickings: stock.picking recordset
+        :param values: wizard values
+        :return: stock.invoice.onshipping recordset
+        """
+        wizard_obj = self.invoice_wizard.with_context(
+            active_ids=pickings.ids,
+            active_model=pickings._name,
+        )
+        fields_list = wizard_obj.fields_get().keys()
+        wizard_values = wizard_obj.default_get(fields_list)
+        wizard_values.update(values)
+        wizard = wizard_obj.create(wizard_values)
+        wizard.onchange_group()
+        return wizard
+
     def test_0_picking_out_invoicing(self):
         # setting Agrolait type to default, because it's 'contact' in demo data
         nb_invoice_before = self.invoice_model.search_count([])
@@ -945,3 +1005,479 @@ class TestPickingInvoicing(SavepointCase):
             "in_refund",
             "Invoice Type should be In Refund",
         )
+
+    def test_picking_invoicing_batch_mode(self):
+        """
+        Test the invoice generation in batch mode: one invoice per picking,
+        all of them created at once.
+        """
+        self.partner.write({"type": "invoice"})
+        picking = self._create_picking_done(self.partner, self.product_test_1)
+        picking2 = self._create_picking_done(
+            self.partner, self.product_test_1 | self.product_test_2, qty=2
+        )
+        pickings = picking | picking2
+        wizard = self._get_invoice_wizard(pickings, group="picking", batch_mode=True)
+        wizard.action_generate()
+        invoices = pickings.mapped("invoice_ids")
+        self.assertEqual(len(invoices), 2)
+        for picking in pickings:
+            self.assertEqual(picking.invoice_state, "invoiced")
+            invoice = picking.invoice_ids
+            self.assertEqual(invoice.picking_ids, picking)
+            self.assertEqual(invoice.partner_id, self.partner)
+            self.assertEqual(len(invoice.invoice_line_ids), len(picking.move_lines))
+            for inv_line in invoice.invoice_line_ids:
+                self.assertTrue(inv_line.tax_ids)
+            self.assertTrue(invoice.amount_total)
+
+    def test_picking_invoicing_batch_mode_create_invoice_hook(self):
+        """
+        Test an override of _create_invoice is still called for each invoice
+        in batch mode.
+        """
+        self.partner.write({"type": "invoice"})
+        picking = self._create_picking_done(self.partner, self.product_test_1)
+        picking2 = self._create_picking_done(self.partner, self.product_test_2)
+        pickings = picking | picking2
+        wizard = self._get_invoice_wizard(pickings, group="picking", batch_mode=True)
+        wizard_class = type(wizard)
+        create_invoice = wizard_class._create_invoice
+
+        def _create_invoice(self, invoice_values):
+            invoice_values["ref"] = "Created by the hook"
+            return create_invoice(self, invoice_values)
+
+        with mock.patch.object(
+            wizard_class,
+            "_create_invoice",
+            autospec=True,
+            side_effect=_create_invoice,
+        ) as create_invoice_mock:
+            wizard.action_generate()
+        self.assertEqual(create_invoice_mock.call_count, 2)
+        invoices = pickings.mapped("invoice_ids")
+        self.assertEqual(len(invoices), 2)
+        self.assertEqual(set(invoices.mapped("ref")), {"Created by the hook"})
+
+    def test_picking_invoicing_resolved_values(self):
+        """
+        Test the invoice onchange is simulated once for many invoices of the
+        same partner and the line onchange once per product.
+        """
+        self.partner.write({"type": "invoice"})
+        picking = self._create_picking_done(self.partner, self.product_test_1)
+        picking2 = self._create_picking_done(self.partner, self.product_test_1)
+        pickings = picking | picking2
+        wizard = self._get_invoice_wizard(pickings, group="picking")
+        wizard_class = type(wizard)
+        with mock.patch.object(
+            wizard_class,
+            "_simulate_invoice_onchange",
+            autospec=True,
+            side_effect=wizard_class._simulate_invoice_onchange,
+        ) as simulate_onchange, mock.patch.object(
+            wizard_class,
+            "_simulate_invoice_line_onchange",
+            autospec=True,
+            side_effect=wizard_class._simulate_invoice_line_onchange,
+        ) as simulate_line_onchange:
+            wizard.action_generate()
+        self.assertEqual(simulate_onchange.call_count, 1)
+        self.assertEqual(simulate_line_onchange.call_count, 1)
+        invoices = pickings.mapped("invoice_ids")
+        self.assertEqual(len(invoices), 2)
+        self.assertNotEqual(invoices[0].invoice_origin, invoices[1].invoice_origin)
+        for invoice in invoices:
+            self.assertEqual(invoice.partner_id, self.partner)
+            self.assertEqual(len(invoice.picking_ids), 1)
+            inv_line = invoice.invoice_line_ids
+            self.assertEqual(inv_line.product_id, self.product_test_1)
+            self.assertEqual(inv_line.product_uom_id, self.product_test_1.uom_id)
+            self.assertEqual(inv_line.account_id, self.account_revenue)
+            self.assertEqual(inv_line.tax_ids, self.tax_sale_1 | self.tax_sale_2)
+
+    def test_picking_split_grouped(self):
+        """
+        Test the split of pickings by partner when grouping, based on the
+        balance between deliveries and returns of each partner.
+        """
+        self.partner.write({"type": "invoice"})
+        picking = self._create_picking_done(self.partner, self.product_test_1)
+        picking2 = self._create_picking_done(self.partner3, self.product_test_2)
+        return_picking = self.picking_model.create(
+            {
+                "partner_id": self.partner3.id,
+                "picking_type_id": self.pick_type_in.id,
+                "location_id": self.customers_location.id,
+                "location_dest_id": self.stock_location.id,
+                "move_lines": [
+                    (
+                        0,
+                        0,
+                        {
+                            "product_id": self.product_test_2.id,
+                            "location_id": self.customers_location.id,
+                            "location_dest_id": self.stock_location.id,
+                            "name": self.product_test_2.name,
+                            "product_uom_qty": 5,
+                            "product_uom": self.product_test_2.uom_id.id,
+                        },
+                    )
+                ],
+            }
+        )
+        pickings = picking | picking2 | return_picking
+        wizard = self._get_invoice_wizard(pickings, group="partner")
+        (
+            sale_pickings,
+            sale_refund_pickings,
+            purchase_pickings,
+            purchase_refund_pickings,
+        ) = wizard.get_split_pickings_grouped(pickings)
+        self.assertEqual(sale_pickings, picking)
+        self.assertEqual(sale_refund_pickings, picking2 | return_picking)
+        self.assertFalse(purchase_pickings)
+        self.assertFalse(purchase_refund_pickings)
+        self.assertTrue(wizard.show_sale_journal)
+        self.assertFalse(wizard.show_purchase_journal)
+
+    def test_price_unit_invoice_batch(self):
+        """
+        Test the prices of many invoice lines computed at once are the same
+        as the ones computed line by line.
+        """
+        pricelist = self.env["product.pricelist"].create(
+            {
+                "name": "Test quantity pricelist",
+                "item_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "applied_on": "0_product_variant",
+                            "product_id": self.product_test_1.id,
+                            "min_quantity": 10,
+                            "compute_price": "fixed",
+                            "fixed_price": 100.0,
+                        },
+                    )
+                ],
+            }
+        )
+        self.partner.write({"property_product_pricelist": pricelist.id})
+        picking = self._create_picking_done(
+            self.partner, self.product_test_1 | self.product_test_2
+        )
+        move1 = picking.move_lines.filtered(
+            lambda m: m.product_id == self.product_test_1
+        )
+        move2 = picking.move_lines - move1
+        no_partner = self.partner_model.browse()
+        moves_qty_partner = [
+            (move1, 1, self.partner),
+            (move1, 10, self.partner),
+            (move2, 10, self.partner),
+            (move1, 10, no_partner),
+        ]
+        prices = self.move_model._get_price_unit_invoice_batch(
+            "out_invoice", moves_qty_partner
+        )
+        self.assertEqual(prices, [15000.0, 100.0, 15000.0, 15000.0])
+        for (moves, qty, partner), price in zip(moves_qty_partner, prices):
+            self.assertAlmostEqual(
+                moves._get_price_unit_invoice("out_invoice", partner, qty), price
+            )
+        # Invoice lines read their price from the batch evaluation
+        wizard = self._get_invoice_wizard(picking, batch_mode=True)
+        wizard.action_generate()
+        inv_lines = picking.invoice_ids.invoice_line_ids
+        self.assertEqual(len(inv_lines), 2)
+        for inv_line in inv_lines:
+            self.assertAlmostEqual(inv_line.price_unit, 15000.0)
+
+    def test_picking_invoicing_cache(self):
+        """
+        Test taxes and accounts are mapped once per product, fiscal position
+        and invoice type during a run.
+        """
+        self.partner.write({"type": "invoice"})
+        picking = self._create_picking_done(self.partner, self.product_test_1)
+        picking2 = self._create_picking_done(
+            self.partner, self.product_test_1 | self.product_test_2
+        )
+        pickings = picking | picking2
+        wizard = self._get_invoice_wizard(pickings, group="picking")
+        cache = InvoicingCache()
+        wizard.with_context(**{INVOICING_CACHE_KEY: cache}).action_generate()
+        self.assertEqual(len(pickings.mapped("invoice_ids")), 2)
+        for namespace in ("taxes", "account"):
+            self.assertEqual(cache.stats[namespace], {"hits": 1, "misses": 2})
+        taxes = self.tax_sale_1 | self.tax_sale_2
+        for inv_line in pickings.mapped("invoice_ids.invoice_line_ids"):
+            self.assertEqual(inv_line.tax_ids, taxes)
+            self.assertEqual(inv_line.account_id, self.account_revenue)
+
+    def test_picking_invoicing_cache_values_kept(self):
+        """
+        Test the invoice lines keep the taxes memoized during the run over
+        the ones of the line onchange.
+        """
+        self.partner.write({"type": "invoice"})
+        picking = self._create_picking_done(self.partner, self.product_test_1)
+        wizard = self._get_invoice_wizard(picking, group="picking")
+        cache = InvoicingCache()
+        cache.set(
+            "taxes",
+            (self.product_test_1.id, False, "out_invoice", self.env.company.id),
+            self.tax_sale_1.ids,
+        )
+        wizard.with_context(**{INVOICING_CACHE_KEY: cache}).action_generate()
+        invoice = picking.invoice_ids
+        self.assertFalse(invoice.fiscal_position_id)
+        self.assertEqual(invoice.invoice_line_ids.tax_ids, self.tax_sale_1)
+        self.assertEqual(invoice.invoice_line_ids.account_id, self.account_revenue)
+
+    def test_cron_invoice_pickings(self):
+        """
+        Test the scheduled action invoices all the done pickings to be
+        invoiced, grouped by partner even when split in many chunks, each
+        chunk being committed.
+        """
+        self.partner.write({"type": "invoice"})
+        picking = self._create_picking_done(self.partner, self.product_test_1)
+        picking2 = self._create_picking_done(self.partner, self.product_test_2)
+        picking3 = self._create_picking_done(self.partner3, self.product_test_1)
+        picking_todo = picking3.copy()
+        picking_todo.set_to_be_invoiced()
+        picking_class = type(self.picking_model)
+        with mock.patch.object(
+            picking_class,
+            "_commit_invoicing_chunk",
+            autospec=True,
+            side_effect=picking_class._commit_invoicing_chunk,
+        ) as commit_chunk:
+            invoices = self.picking_model.cron_invoice_pickings(
+                group="partner", chunk_size=1
+            )
+        # One chunk per partner
+        self.assertEqual(commit_chunk.call_count, 2)
+        self.assertIn(picking.invoice_ids, invoices)
+        self.assertEqual(picking.invoice_ids, picking2.invoice_ids)
+        self.assertEqual(len(picking.invoice_ids.invoice_line_ids), 2)
+        self.assertIn(picking3.invoice_ids, invoices)
+        self.assertNotEqual(picking.invoice_ids, picking3.invoice_ids)
+        for done_picking in picking | picking2 | picking3:
+            self.assertEqual(done_picking.invoice_state, "invoiced")
+        self.assertEqual(picking_todo.invoice_state, "2binvoiced")
+        self.assertFalse(picking_todo.invoice_ids)
+
+    def test_picking_invoice_state_transition(self):
+        """
+        Test pickings and their moves change of invoice state together,
+        only records really changed are returned and the cache is up to date.
+        """
+        picking = self._create_picking_done(
+            self.partner, self.product_test_1 | self.product_test_2
+        )
+        picking2 = self._create_picking_done(self.partner, self.product_test_1)
+        pickings = picking | picking2
+        moves = pickings.mapped("move_lines")
+        picking2._set_as_invoiced()
+        self.assertEqual(picking2.invoice_state, "invoiced")
+        self.assertEqual(set(picking2.move_lines.mapped("invoice_state")), {"invoiced"})
+        changed = pickings._set_as_invoiced()
+        self.assertEqual(changed, picking)
+        self.assertEqual(set(pickings.mapped("invoice_state")), {"invoiced"})
+        self.assertEqual(set(moves.mapped("invoice_state")), {"invoiced"})
+        self.assertFalse(pickings._set_as_invoiced())
+        changed = pickings._set_as_2binvoiced()
+        self.assertEqual(changed, pickings)
+        self.assertEqual(set(moves.mapped("invoice_state")), {"2binvoiced"})
+        self.assertEqual(
+            self.picking_model.search(
+                [("id", "in", pickings.ids), ("invoice_state", "=", "2binvoiced")]
+            ),
+            pickings,
+        )
+
+    def test_invoice_cancel_invoice_state(self):
+        """
+        Test cancelling an invoice updates its pickings and their moves with
+        a single update each, record rules being checked on moves too.
+        """
+        self.partner.write({"type": "invoice"})
+        picking = self._create_picking_done(
+            self.partner, self.product_test_1 | self.product_test_2
+        )
+        wizard = self._get_invoice_wizard(picking, group="picking")
+        wizard.action_generate()
+        invoice = picking.invoice_ids
+        self.assertEqual(picking.invoice_state, "invoiced")
+        move_class = type(self.env["stock.move"])
+        with mock.patch.object(
+            move_class,
+            "_write_invoice_state",
+            autospec=True,
+            side_effect=move_class._write_invoice_state,
+        ) as write_state, mock.patch.object(
+            move_class,
+            "check_access_rule",
+            autospec=True,
+            side_effect=move_class.check_access_rule,
+        ) as check_rule:
+            invoice.button_cancel()
+        self.assertEqual(write_state.call_count, 1)
+        check_rule.assert_any_call(picking.move_lines, "write")
+        self.assertEqual(picking.invoice_state, "2binvoiced")
+        self.assertEqual(
+            set(picking.move_lines.mapped("invoice_state")), {"2binvoiced"}
+        )
+
+    def test_2binvoiced_index(self):
+        """
+        Check the partial index used to count pickings to invoice is created
+        """
+        self.env.cr.execute("DROP INDEX IF EXISTS stock_picking_2binvoiced_index")
+        self.picking_model.init()
+        self.env.cr.execute(
+            """
+            SELECT indexdef FROM pg_indexes
+            WHERE tablename = 'stock_picking'
+            AND indexname = 'stock_picking_2binvoiced_index'
+            """
+        )
+        row = self.env.cr.fetchone()
+        self.assertTrue(row)
+        self.assertIn("(picking_type_id)", row[0])
+        self.assertIn("'2binvoiced'", row[0])
+
+    def test_counting_2binvoiced_invoice_state(self):
+        """
+        Check the counter of pickings to invoice follows the invoice state
+        of pickings
+        """
+        pick_type = self.pick_type_out
+        count = pick_type.count_picking_2binvoiced
+        picking = self._create_picking_done(self.partner, self.product_test_1)
+        pick_type.invalidate_cache(["count_picking_2binvoiced"])
+        self.assertEqual(count + 1, pick_type.count_picking_2binvoiced)
+        picking._set_as_invoiced()
+        pick_type.invalidate_cache(["count_picking_2binvoiced"])
+        self.assertEqual(count, pick_type.count_picking_2binvoiced)
+
+    def test_picking_invoicing_max_lines(self):
+        """
+        Test the invoices grouped by partner are split when they have more
+        lines than the limit.
+        """
+        self.partner.write({"type": "invoice"})
+        picking = self._create_picking_done(
+            self.partner, self.product_test_1 | self.product_test_2
+        )
+        picking2 = self._create_picking_done(self.partner, self.product_test_1)
+        pickings = picking | picking2
+        wizard = self._get_invoice_wizard(
+            pickings, group="partner", max_lines_per_invoice=2
+        )
+        wizard.action_generate()
+        invoices = pickings.mapped("invoice_ids")
+        self.assertEqual(len(invoices), 2)
+        self.assertEqual(
+            sorted(len(invoice.invoice_line_ids) for invoice in invoices), [1, 2]
+        )
+        self.assertEqual(
+            invoices.mapped("invoice_line_ids.move_line_ids"),
+            pickings.mapped("move_lines"),
+        )
+        for invoice in invoices:
+            self.assertEqual(
+                invoice.picking_ids,
+                invoice.mapped("invoice_line_ids.move_line_ids.picking_id"),
+            )
+        for picking in pickings:
+            self.assertEqual(picking.invoice_state, "invoiced")
+
+    def test_picking_invoicing_split_fiscal_position(self):
+        """
+        Test the invoices are split by fiscal position of the moves, given
+        by their delivery addresses, and keep it.
+        """
+        self.partner.write({"type": "invoice"})
+        tax_mapped = self.tax_model.create(
+            {"name": "Sale tax 5", "type_tax_use": "sale", "amount": "5.00"}
+        )
+        account_mapped = self.account_model.create(
+            {
+                "code": "TSFP",
+                "name": "Test Split Fiscal Position Revenue",
+                "user_type_id": self.account_user_type.id,
+            }
+        )
+        fiscal_position = self.fiscal_position_model.create(
+            {
+                "name": "Test Split Fiscal Position",
+                "tax_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "tax_src_id": self.tax_sale_1.id,
+                            "tax_dest_id": tax_mapped.id,
+                        },
+                    )
+                ],
+                "account_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "account_src_id": self.account_revenue.id,
+                            "account_dest_id": account_mapped.id,
+                        },
+                    )
+                ],
+            }
+        )
+        address = self.partner_model.create(
+            {
+                "name": "Other delivery address",
+                "property_account_position_id": fiscal_position.id,
+            }
+        )
+        picking = self._create_picking_done(
+            self.partner, self.product_test_1 | self.product_test_2
+        )
+        move = picking.move_lines.filtered(
+            lambda m: m.product_id == self.product_test_1
+        )
+        move.write({"partner_id": address.id})
+        partner_fiscal_position = self.fiscal_position_model.get_fiscal_position(
+            self.partner.id, delivery_id=picking.partner_id.id
+        )
+        self.assertNotEqual(partner_fiscal_position, fiscal_position)
+        wizard = self._get_invoice_wizard(
+            picking, group="partner", split_by_fiscal_position=True
+        )
+        wizard.action_generate()
+        invoices = picking.invoice_ids
+        self.assertEqual(len(invoices), 2)
+        invoice = invoices.filtered(lambda i: i.fiscal_position_id == fiscal_position)
+        inv_line = invoice.invoice_line_ids
+        self.assertEqual(inv_line.product_id, self.product_test_1)
+        # Lines are mapped by the fiscal position of their invoice
+        self.assertEqual(inv_line.tax_ids, tax_mapped | self.tax_sale_2)
+        self.assertEqual(inv_line.account_id, account_mapped)
+        other_invoice = invoices - invoice
+        self.assertEqual(other_invoice.fiscal_position_id, partner_fiscal_position)
+        other_line = other_invoice.invoice_line_ids
+        self.assertEqual(other_line.product_id, self.product_test_2)
+        self.assertEqual(
+            other_line.tax_ids,
+            partner_fiscal_position.map_tax(self.tax_sale_1 | self.tax_sale_2),
+        )
+        self.assertEqual(
+            other_line.account_id,
+            partner_fiscal_position.map_account(self.account_revenue),
+        )
+        self.assertEqual(picking.invoice_state, "invoiced")
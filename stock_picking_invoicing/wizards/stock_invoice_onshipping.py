@@ -1,9 +1,16 @@
 # Copyright (C) 2019-Today: Odoo Community Association (OCA)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import copy
+import logging
+
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 
+from ..invoicing_cache import INVOICING_CACHE_KEY, InvoicingCache
+
+_logger = logging.getLogger(__name__)
+
 JOURNAL_TYPE_MAP = {
     ("outgoing", "customer"): ["sale"],
     ("outgoing", "supplier"): ["purchase"],
@@ -83,6 +90,22 @@ class StockInvoiceOnshipping(models.TransientModel):
     )
     show_sale_journal = fields.Boolean()
     show_purchase_journal = fields.Boolean()
+    batch_mode = fields.Boolean(
+        string="Create in Batch",
+        help="Build the values of every invoice first and create all of them "
+        "in a single call. Recommended when invoicing a large number of "
+        "pickings.",
+    )
+    max_lines_per_invoice = fields.Integer(
+        string="Max Lines per Invoice",
+        help="Split the invoices having more lines than this limit into "
+        "several invoices. 0 means no limit.",
+    )
+    split_by_fiscal_position = fields.Boolean(
+        help="Create one invoice per fiscal position, the fiscal position of "
+        "each move being computed from the invoice address of its picking and "
+        "its own delivery address.",
+    )
 
     @api.model
     def default_get(self, fields_list):
@@ -107,25 +130,52 @@ class StockInvoiceOnshipping(models.TransientModel):
         self.show_sale_journal = bool(sale_pickings)
         self.show_purchase_journal = bool(purchase_pickings)
 
-    def get_partner_sum(self, pickings, partner, inv_type, picking_type, usage):
-        pickings = pickings.filtered(
-            lambda x: x.picking_type_id.code == picking_type and x.partner_id == partner
-        )
-        lines = pickings.mapped("move_lines")
-        if picking_type == "outgoing":
-            moves = lines.filtered(lambda x: x.location_dest_id.usage == usage)
-        else:
-            moves = lines.filtered(lambda x: x.location_id.usage == usage)
-        total = sum(
-            [
-                (
-                    m._get_price_unit_invoice(inv_type, m.picking_id.partner_id)
-                    * m.product_uom_qty
-                )
-                for m in moves
-            ]
-        )
-        return total, moves.mapped("picking_id")
+    def _get_partner_sums(self, pickings):
+        """
+        Index the moves of given pickings by partner, picking type code and
+        location usage (destination for outgoing pickings, source otherwise)
+        and sum their invoiceable amount, in a single pass.
+        :param pickings: stock.picking recordset
+        :return: dict {(partner, code, usage): (total, stock.picking recordset)}
+        """
+        usage_inv_types = {"customer": "out_invoice", "supplier": "in_invoice"}
+        moves_data = []
+        price_keys = {}
+        for move in pickings.mapped("move_lines"):
+            picking = move.picking_id
+            code = picking.picking_type_id.code
+            if code == "outgoing":
+                usage = move.location_dest_id.usage
+            else:
+                usage = move.location_id.usage
+            inv_type = usage_inv_types.get(usage)
+            if not inv_type:
+                continue
+            partner = picking.partner_id
+            # Only evaluate the price once per product/uom and partner
+            price_key = (move.product_id, move.product_uom, partner)
+            price_keys.setdefault(inv_type, {}).setdefault(price_key, move)
+            moves_data.append((move, (partner, code, usage), inv_type, price_key))
+        prices = {}
+        stock_move_obj = self.env["stock.move"]
+        for inv_type, moves_by_key in price_keys.items():
+            price_units = stock_move_obj._get_price_unit_invoice_batch(
+                inv_type,
+                [(move, 1, key[2]) for key, move in moves_by_key.items()],
+            )
+            for price_key, price_unit in zip(moves_by_key, price_units):
+                prices[(inv_type, price_key)] = price_unit
+        totals = {}
+        picking_ids = {}
+        for move, key, inv_type, price_key in moves_data:
+            amount = prices[(inv_type, price_key)] * move.product_uom_qty
+            totals[key] = totals.get(key, 0.0) + amount
+            picking_ids.setdefault(key, {})[move.picking_id.id] = True
+        picking_obj = self.env["stock.picking"]
+        return {
+            key: (total, picking_obj.browse(list(picking_ids[key])))
+            for key, total in totals.items()
+        }
 
     def get_split_pickings(self):
         self.ensure_one()
@@ -136,38 +186,41 @@ class StockInvoiceOnshipping(models.TransientModel):
         return self.get_split_pickings_nogrouped(pickings)
 
     def get_split_pickings_grouped(self, pickings):
-        sale_pickings = self.env["stock.picking"].browse()
-        sale_refund_pickings = self.env["stock.picking"].browse()
-        purchase_pickings = self.env["stock.picking"].browse()
-        purchase_refund_pickings = self.env["stock.picking"].browse()
+        picking_obj = self.env["stock.picking"]
+        sale_pickings = []
+        sale_refund_pickings = []
+        purchase_pickings = []
+        purchase_refund_pickings = []
 
+        partner_sums = self._get_partner_sums(pickings)
+        no_sum = (0.0, picking_obj.browse())
         for partner in pickings.mapped("partner_id"):
-            so_sum, so_pickings = self.get_partner_sum(
-                pickings, partner, "out_invoice", "outgoing", "customer"
+            so_sum, so_pickings = partner_sums.get(
+                (partner, "outgoing", "customer"), no_sum
             )
-            si_sum, si_pickings = self.get_partner_sum(
-                pickings, partner, "out_invoice", "incoming", "customer"
+            si_sum, si_pickings = partner_sums.get(
+                (partner, "incoming", "customer"), no_sum
             )
             if (so_sum - si_sum) >= 0:
-                sale_pickings |= so_pickings | si_pickings
+                sale_pickings += [so_pickings, si_pickings]
             else:
-                sale_refund_pickings |= so_pickings | si_pickings
-            pi_sum, pi_pickings = self.get_partner_sum(
-                pickings, partner, "in_invoice", "incoming", "supplier"
+                sale_refund_pickings += [so_pickings, si_pickings]
+            pi_sum, pi_pickings = partner_sums.get(
+                (partner, "incoming", "supplier"), no_sum
             )
-            po_sum, po_pickings = self.get_partner_sum(
-                pickings, partner, "in_invoice", "outgoing", "supplier"
+            po_sum, po_pickings = partner_sums.get(
+                (partner, "outgoing", "supplier"), no_sum
             )
             if (pi_sum - po_sum) >= 0:
-                purchase_pickings |= pi_pickings | po_pickings
+                purchase_pickings += [pi_pickings, po_pickings]
             else:
-                purchase_refund_pickings |= pi_pickings | po_pickings
+                purchase_refund_pickings += [pi_pickings, po_pickings]
 
         return (
-            sale_pickings,
-            sale_refund_pickings,
-            purchase_pickings,
-            purchase_refund_pickings,
+            picking_obj.union(*sale_pickings),
+            picking_obj.union(*sale_refund_pickings),
+            picking_obj.union(*purchase_pickings),
+            picking_obj.union(*purchase_refund_pickings),
         )
 
     def get_split_pickings_nogrouped(self, pickings):
@@ -332,6 +385,17 @@ class StockInvoiceOnshipping(models.TransientModel):
             grouped_picking.update({key: picks_grouped})
         return grouped_picking.values()
 
+    def _get_invoicing_cache(self):
+        """
+        Get the cache shared during the current invoicing run
+        :return: InvoicingCache
+        """
+        cache = self.env.context.get(INVOICING_CACHE_KEY)
+        if cache is None:
+            # Out of an invoicing run: nothing to share
+            cache = InvoicingCache()
+        return cache
+
     def _simulate_invoice_onchange(self, values):
         """
         Simulate onchange for invoice
@@ -345,6 +409,52 @@ class StockInvoiceOnshipping(models.TransientModel):
         values.update(new_values)
         return invoice, values
 
+    def _get_invoice_default_values(self):
+        """
+        Get the default values of an invoice (computed once per run)
+        :return: dict
+        """
+        invoice_obj = self.env["account.move"]
+        values = self._get_invoicing_cache().get(
+            "invoice_defaults",
+            None,
+            lambda: invoice_obj.default_get(invoice_obj.fields_get().keys()),
+        )
+        return copy.deepcopy(values)
+
+    def _get_invoice_values_key(self, values):
+        """
+        Get the key used to share the values resolved by the invoice onchange
+        :param values: dict
+        :return: tuple
+        """
+        return (
+            values["partner_id"],
+            values["fiscal_position_id"],
+            values["journal_id"],
+            values["move_type"],
+            values["currency_id"],
+            values["company_id"],
+        )
+
+    def _resolve_invoice_values(self, values):
+        """
+        Complete given values with invoice defaults and the values set by
+        the partner onchange. They are computed once per partner, fiscal
+        position and journal for the whole run.
+        :param values: dict
+        :return: account.move (virtual record), dict
+        """
+        key = self._get_invoice_values_key(values)
+        invoice, resolved_values = self._get_invoicing_cache().get(
+            "invoice_values",
+            key,
+            lambda: self._simulate_invoice_onchange(
+                dict(self._get_invoice_default_values(), **values)
+            ),
+        )
+        return invoice, copy.deepcopy(resolved_values)
+
     def _build_invoice_values_from_pickings(self, pickings):
         """
         Build dict to create a new invoice from given pickings
@@ -366,11 +476,8 @@ class StockInvoiceOnshipping(models.TransientModel):
             if partner.property_product_pricelist and code == "outgoing":
                 currency = partner.property_product_pricelist.currency_id
         journal = self._get_journal()
-        invoice_obj = self.env["account.move"]
-        values = invoice_obj.default_get(invoice_obj.fields_get().keys())
-        values.update(
+        invoice, values = self._resolve_invoice_values(
             {
-                "invoice_origin": ", ".join(pickings.mapped("name")),
                 "user_id": self.env.user.id,
                 "partner_id": partner_id,
                 "invoice_payment_term_id": payment_term,
@@ -379,11 +486,14 @@ class StockInvoiceOnshipping(models.TransientModel):
                 "company_id": company.id,
                 "currency_id": currency.id,
                 "journal_id": journal.id,
+            }
+        )
+        values.update(
+            {
+                "invoice_origin": ", ".join(pickings.mapped("name")),
                 "picking_ids": [(4, p.id, False) for p in pickings],
             }
         )
-
-        invoice, values = self._simulate_invoice_onchange(values)
         return invoice, values
 
     def _get_move_key(self, move):
@@ -412,6 +522,132 @@ class StockInvoiceOnshipping(models.TransientModel):
             grouped_moves.update({key: move_grouped})
         return grouped_moves.values()
 
+    def _get_invoice_line_default_values(self, product, fiscal_position, inv_type):
+        """
+        Get the default values of an invoice line for the given product.
+        They are computed once per product, fiscal position and invoice type
+        for the whole run.
+        :param product: product.product recordset
+        :param fiscal_position: account.fiscal.position recordset
+        :param inv_type: str
+        :return: dict
+        """
+        cache = self._get_invoicing_cache()
+        line_obj = self.env["account.move.line"]
+
+        def _compute():
+            values = cache.get(
+                "invoice_line_defaults",
+                None,
+                lambda: line_obj.default_get(line_obj.fields_get().keys()),
+            )
+            values = dict(values)
+            values.update(
+                {
+                    "product_id": product.id,
+                    "product_uom_id": product.uom_id.id,
+                }
+            )
+            return values
+
+        values = cache.get(
+            "invoice_line_values",
+            (product.id, fiscal_position.id, inv_type),
+            _compute,
+        )
+        return copy.deepcopy(values)
+
+    def _get_invoice_line_quantity(self, moves, inv_type):
+        """
+        Get the quantity of the invoice line created from given moves
+        :param moves: stock.move recordset
+        :param inv_type: str
+        :return: float
+        """
+        quantity = 0
+        for move in moves:
+            qty = move.product_uom_qty
+            loc = move.location_id
+            loc_dst = move.location_dest_id
+            # Better to understand with IF/ELIF than many OR
+            if inv_type == "out_invoice" and loc.usage == "customer":
+                qty *= -1
+            elif inv_type == "out_refund" and loc_dst.usage == "customer":
+                qty *= -1
+            elif inv_type == "in_invoice" and loc_dst.usage == "supplier":
+                qty *= -1
+            elif inv_type == "in_refund" and loc.usage == "supplier":
+                qty *= -1
+            quantity += qty
+        return quantity
+
+    @api.model
+    def _get_price_unit_key(self, moves, inv_type, partner):
+        """
+        Get the key of the price unit of the invoice line created from given
+        moves, in the cache of the run
+        :param moves: stock.move recordset
+        :param inv_type: str
+        :param partner: res.partner recordset
+        :return: tuple
+        """
+        return tuple(moves.ids), inv_type, partner.id
+
+    def _compute_invoice_lines_price_unit(self, invoices_data):
+        """
+        Price all the invoice lines to create at once; prices are then read
+        from the cache of the run by _get_invoice_line_values
+        :param invoices_data: list of tuple (account.move, dict of invoice
+            values, list of stock.move recordset)
+        """
+        lines_data = {}
+        for _invoice, invoice_values, moves_list in invoices_data:
+            inv_type = invoice_values["move_type"]
+            partner = self.env["res.partner"].browse(invoice_values["partner_id"])
+            for moves in moves_list:
+                quantity = self._get_invoice_line_quantity(moves, inv_type)
+                lines_data.setdefault(inv_type, []).append((moves, quantity, partner))
+        cache = self._get_invoicing_cache()
+        for inv_type, moves_qty_partner in lines_data.items():
+            prices = self.env["stock.move"]._get_price_unit_invoice_batch(
+                inv_type, moves_qty_partner
+            )
+            for (moves, _quantity, partner), price in zip(moves_qty_partner, prices):
+                key = self._get_price_unit_key(moves, inv_type, partner)
+                cache.set("price_unit", key, price)
+
+    def _get_invoice_line_account(self, moves, fiscal_position, inv_type):
+        """
+        Get the account of the invoice line created from given moves.
+        It's computed once per product, fiscal position, invoice type and
+        company for the whole run.
+        :param moves: stock.move recordset
+        :param fiscal_position: account.fiscal.position recordset
+        :param inv_type: str
+        :return: account.account recordset
+        """
+        move = fields.first(moves)
+        product = move.product_id
+
+        def _compute():
+            categ = product.categ_id
+            if inv_type in ("out_invoice", "out_refund"):
+                account = product.property_account_income_id
+                if not account:
+                    account = categ.property_account_income_categ_id
+            else:
+                account = product.property_account_expense_id
+                if not account:
+                    account = categ.property_account_expense_categ_id
+            return move._get_account(fiscal_position, account).id
+
+        account_id = self._get_invoicing_cache().get(
+            "account",
+            (product.id, fiscal_position.id, inv_type, self.env.company.id),
+            _compute,
+        )
+        return self.env["account.account"].browse(account_id)
+
     def _simulate_invoice_line_onchange(self, values, price_unit=None):
         """
         Simulate onchange for invoice line
@@ -427,6 +663,54 @@ class StockInvoiceOnshipping(models.TransientModel):
         values.update(new_values)
         return values
 
+    def _get_invoice_line_onchange_key(self, values, invoice_values):
+        """
+        Get the key used to share the values resolved by the invoice line
+        onchange
+        :param values: dict
+        :param invoice_values: dict
+        :return: tuple
+        """
+        return (
+            values["product_id"],
+            invoice_values["fiscal_position_id"],
+            invoice_values["move_type"],
+        )
+
+    def _resolve_invoice_line_values(self, values, invoice_values):
+        """
+        Complete given values with the ones set by the invoice line onchange.
+        They are computed once per product, fiscal position and invoice type
+        for the whole run; the values specific to the line are kept, as well
+        as its account and taxes, mapped by the fiscal position of the invoice
+        values (the virtual invoice of the onchange may have another one).
+        :param values: dict
+        :param invoice_values: dict
+        :return: dict
+        """
+        line_values = {
+            field_name: values[field_name]
+            for field_name in (
+                "name",
+                "quantity",
+                "price_unit",
+                "account_id",
+                "tax_ids",
+                "move_line_ids",
+                "move_id",
+            )
+        }
+        onchange_values = self._get_invoicing_cache().get(
+            "invoice_line_onchange",
+            self._get_invoice_line_onchange_key(values, invoice_values),
+            lambda: self._simulate_invoice_line_onchange(
+                copy.deepcopy(values), price_unit=values["price_unit"]
+            ),
+        )
+        values.update(copy.deepcopy(onchange_values))
+        values.update(line_values)
+        return values
+
     def _get_invoice_line_values(self, moves, invoice_values, invoice):
         """
         Create invoice line values from given moves
@@ -441,44 +725,23 @@ class StockInvoiceOnshipping(models.TransientModel):
             invoice_values["fiscal_position_id"]
         )
         partner_id = self.env["res.partner"].browse(invoice_values["partner_id"])
-        categ = product.categ_id
         inv_type = invoice_values["move_type"]
-        if inv_type in ("out_invoice", "out_refund"):
-            account = product.property_account_income_id
-            if not account:
-                account = categ.property_account_income_categ_id
-        else:
-            account = product.property_account_expense_id
-            if not account:
-                account = categ.property_account_expense_categ_id
-        account = move._get_account(fiscal_position, account)
-        quantity = 0
-        move_line_ids = []
-        for move in moves:
-            qty = move.product_uom_qty
-            loc = move.location_id
-            loc_dst = move.location_dest_id
-            # Better to understand with IF/ELIF than many OR
-            if inv_type == "out_invoice" and loc.usage == "customer":
-                qty *= -1
-            elif inv_type == "out_refund" and loc_dst.usage == "customer":
-                qty *= -1
-            elif inv_type == "in_invoice" and loc_dst.usage == "supplier":
-                qty *= -1
-            elif inv_type == "in_refund" and loc.usage == "supplier":
-                qty *= -1
-            quantity += qty
-            move_line_ids.append((4, move.id, False))
+        account = self._get_invoice_line_account(moves, fiscal_position, inv_type)
+        quantity = self._get_invoice_line_quantity(moves, inv_type)
+        move_line_ids = [(4, move.id, False) for move in moves]
         taxes = moves._get_taxes(fiscal_position, inv_type)
-        price = moves._get_price_unit_invoice(inv_type, partner_id, quantity)
-        line_obj = self.env["account.move.line"]
-        values = line_obj.default_get(line_obj.fields_get().keys())
+        price = self._get_invoicing_cache().get(
+            "price_unit",
+            self._get_price_unit_key(moves, inv_type, partner_id),
+            lambda: moves._get_price_unit_invoice(inv_type, partner_id, quantity),
+        )
+        values = self._get_invoice_line_default_values(
+            product, fiscal_position, inv_type
+        )
         values.update(
             {
                 "name": name,
                 "account_id": account.id,
-                "product_id": product.id,
-                "product_uom_id": product.uom_id.id,
                 "quantity": quantity,
                 "price_unit": price,
                 "tax_ids": [(6, 0, taxes.ids)],
@@ -486,9 +749,7 @@ class StockInvoiceOnshipping(models.TransientModel):
                 "move_id": invoice.id,
             }
         )
-        values = self._simulate_invoice_line_onchange(values, price_unit=price)
-        values.update({"name": name})
-        return values
+        return self._resolve_invoice_line_values(values, invoice_values)
 
     def _update_picking_invoice_status(self, pickings):
         """
@@ -498,13 +759,80 @@ class StockInvoiceOnshipping(models.TransientModel):
         """
         return pickings._set_as_invoiced()
 
+    def _get_move_delivery_address(self, move):
+        """
+        Get the delivery address of the given move: its own destination
+        address, or the one of its picking
+        :param move: stock.move recordset
+        :return: res.partner recordset
+        """
+        return move.partner_id or move.picking_id.partner_id
+
+    def _get_move_fiscal_position(self, move):
+        """
+        Get the fiscal position used to split the invoices by fiscal position.
+        By default, it's based on the invoice address of the picking and on
+        the delivery address of the move, which can differ between the moves
+        invoiced together
+        :param move: stock.move recordset
+        :return: account.fiscal.position recordset
+        """
+        fiscal_position_obj = self.env["account.fiscal.position"]
+        partner_id = move.picking_id._get_partner_to_invoice()
+        delivery = self._get_move_delivery_address(move)
+        fiscal_position_id = self._get_invoicing_cache().get(
+            "fiscal_position",
+            (partner_id, delivery.id),
+            lambda: fiscal_position_obj.get_fiscal_position(
+                partner_id, delivery_id=delivery.id
+            ).id,
+        )
+        return fiscal_position_obj.browse(fiscal_position_id)
+
+    def _split_moves_by_fiscal_position(self, grouped_moves_list):
+        """
+        Split the groups of moves by fiscal position
+        :param grouped_moves_list: list of stock.move recordset
+        :return: list of grouped moves list
+        """
+        parts = {}
+        for moves in grouped_moves_list:
+            moves_by_fiscal_position = {}
+            for move in moves:
+                fiscal_position = self._get_move_fiscal_position(move)
+                moves_by_fiscal_position.setdefault(fiscal_position, move.browse())
+                moves_by_fiscal_position[fiscal_position] |= move
+            for fiscal_position, fp_moves in moves_by_fiscal_position.items():
+                parts.setdefault(fiscal_position, []).append(fp_moves)
+        return list(parts.values())
+
     def ungroup_moves(self, grouped_moves_list):
         """Ungroup your moves, split them again, grouping by
         fiscal position, max itens per invoice and etc
         :param grouped_moves_list:
         :return: list of grouped moves list
         """
-        return [grouped_moves_list]
+        grouped_moves_list = list(grouped_moves_list)
+        if self.split_by_fiscal_position:
+            parts = self._split_moves_by_fiscal_position(grouped_moves_list)
+        else:
+            parts = [grouped_moves_list]
+        max_lines = self.max_lines_per_invoice
+        if max_lines > 0:
+            parts = [
+                part[index : index + max_lines]
+                for part in parts
+                for index in range(0, len(part), max_lines)
+            ]
+        return parts
+
+    def _prepare_invoice_create_values(self, invoice_values):
+        """Override this method if you need to change any values of the
+        invoice and the lines before the invoice creation, in both modes
+        :param invoice_values: dict with the invoice and its lines
+        :return: dict
+        """
+        return invoice_values
 
     def _create_invoice(self, invoice_values):
         """Override this method if you need to change any values of the
@@ -512,44 +840,111 @@ class StockInvoiceOnshipping(models.TransientModel):
         :param invoice_values: dict with the invoice and its lines
         :return: invoice
         """
-        return self.env["account.move"].create(invoice_values)
+        return self.env["account.move"].create(
+            self._prepare_invoice_create_values(invoice_values)
+        )
 
-    def _action_generate_invoices(self):
+    def _is_create_invoice_overridden(self):
         """
-        Action to generate invoices based on pickings
+        Check if _create_invoice is overridden by another module
+        :return: bool
+        """
+        return type(self)._create_invoice is not StockInvoiceOnshipping._create_invoice
+
+    def _create_invoices(self, invoices_values):
+        """Create all the invoices at once (batch mode).
+        When _create_invoice is overridden, it's still called for each
+        invoice, so these invoices are created one by one.
+        :param invoices_values: list of dict with the invoice and its lines
         :return: account.move recordset
         """
-        pickings = self._load_pickings()
-        company = pickings.mapped("company_id")
-        if company and company != self.env.company:
-            raise UserError(_("All pickings are not related to your company!"))
+        if self._is_create_invoice_overridden():
+            invoices = self.env["account.move"].browse()
+            for invoice_values in invoices_values:
+                invoices |= self._create_invoice(invoice_values)
+            return invoices
+        return self.env["account.move"].create(
+            [
+                self._prepare_invoice_create_values(invoice_values)
+                for invoice_values in invoices_values
+            ]
+        )
+
+    def _prepare_invoices_values(self, pickings):
+        """
+        Build the values of every invoice to create from given pickings
+        :param pickings: stock.picking recordset
+        :return: list of dict
+        """
+        invoices_data = []
         pick_list = self._group_pickings(pickings)
-        invoices = self.env["account.move"].browse()
         for pickings in pick_list:
             moves = pickings.mapped("move_lines")
             grouped_moves_list = self._group_moves(moves)
             parts = self.ungroup_moves(grouped_moves_list)
             for moves_list in parts:
+                part_pickings = pickings
+                if len(parts) > 1:
+                    # Only link the pickings of the moves invoiced
+                    part_pickings = (
+                        self.env["stock.move"].union(*moves_list).mapped("picking_id")
+                    )
                 invoice, invoice_values = self._build_invoice_values_from_pickings(
-                    pickings
+                    part_pickings
                 )
-                lines = [(5, 0, {})]
-                line_values = False
-                for moves in moves_list:
-                    line_values = self._get_invoice_line_values(
-                        moves, invoice_values, invoice
-                    )
-                    if line_values:
-                        lines.append((0, 0, line_values))
-                if line_values:  # Only create the invoice if it has lines
-                    invoice_values["invoice_line_ids"] = lines
-                    invoice_values["invoice_date"] = self.invoice_date
-                    # this is needed otherwise invoice_line_ids are removed
-                    # in _move_autocomplete_invoice_lines_create
-                    # and no invoice line is created
-                    invoice_values.pop("line_ids")
-                    invoice = self._create_invoice(invoice_values)
-                    invoice._onchange_invoice_line_ids()
-                    invoice._compute_amount()
-                    invoices |= invoice
+                if self.split_by_fiscal_position:
+                    # Keep the fiscal position of the moves over the one set
+                    # by the partner onchange
+                    fiscal_position = self._get_move_fiscal_position(moves_list[0][0])
+                    invoice_values["fiscal_position_id"] = fiscal_position.id
+                invoices_data.append((invoice, invoice_values, moves_list))
+        self._compute_invoice_lines_price_unit(invoices_data)
+        invoices_values = []
+        for invoice, invoice_values, moves_list in invoices_data:
+            lines = [(5, 0, {})]
+            line_values = False
+            for moves in moves_list:
+                line_values = self._get_invoice_line_values(
+                    moves, invoice_values, invoice
+                )
+                if line_values:
+                    lines.append((0, 0, line_values))
+            if line_values:  # Only create the invoice if it has lines
+                invoice_values["invoice_line_ids"] = lines
+                invoice_values["invoice_date"] = self.invoice_date
+                # this is needed otherwise invoice_line_ids are removed
+                # in _move_autocomplete_invoice_lines_create
+                # and no invoice line is created
+                invoice_values.pop("line_ids")
+                invoices_values.append(invoice_values)
+        return invoices_values
+
+    def _action_generate_invoices(self):
+        """
+        Action to generate invoices based on pickings
+        :return: account.move recordset
+        """
+        if INVOICING_CACHE_KEY not in self.env.context:
+            self = self.with_context(**{INVOICING_CACHE_KEY: InvoicingCache()})
+        pickings = self._load_pickings()
+        company = pickings.mapped("company_id")
+        if company and company != self.env.company:
+            raise UserError(_("All pickings are not related to your company!"))
+        invoices_values = self._prepare_invoices_values(pickings)
+        if self.batch_mode:
+            # Dynamic lines (taxes, payment terms) are already computed by
+            # account.move.create, only the totals are recomputed, once.
+            invoices = self._create_invoices(invoices_values)
+            invoices._compute_amount()
+        else:
+            invoices = self.env["account.move"].browse()
+            for invoice_values in invoices_values:
+                invoice = self._create_invoice(invoice_values)
+                invoice._onchange_invoice_line_ids()
+                invoice._compute_amount()
+                invoices |= invoice
+        _logger.debug(
+            "Picking invoicing cache (hits/misses): %s",
+            self._get_invoicing_cache().stats,
+        )
         return invoices
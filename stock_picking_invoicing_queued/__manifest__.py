@@ -0,0 +1,19 @@
+# Copyright (C) 2019-Today: Odoo Community Association (OCA)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+{
+    "name": "Stock Picking Invoicing Queued",
+    "summary": "Enqueue the invoicing of pickings in background jobs",
+    "version": "14.0.1.0.0",
+    "category": "Warehouse Management",
+    "author": "Odoo Community Association (OCA)",
+    "website": "https://github.com/OCA/account-invoicing",
+    "license": "AGPL-3",
+    "depends": ["stock_picking_invoicing", "queue_job"],
+    "data": [
+        "data/queue_job.xml",
+        "views/queue_job_views.xml",
+        "views/stock_picking_views.xml",
+        "wizards/stock_invoice_onshipping_view.xml",
+    ],
+    "installable": True,
+}
@@ -0,0 +1,96 @@
+# Copyright (C) 2019-Today: Odoo Community Association (OCA)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+
+from odoo import _, fields, models
+
+from odoo.addons.stock_picking_invoicing.invoicing_cache import (
+    INVOICING_CACHE_KEY,
+    InvoicingCache,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+class StockPicking(models.Model):
+    _inherit = "stock.picking"
+
+    invoicing_job_ids = fields.Many2many(
+        comodel_name="queue.job",
+        column1="picking_id",
+        column2="job_id",
+        string="Invoicing Jobs",
+        copy=False,
+    )
+
+    def _get_invoicing_wizard(self, wizard_values):
+        """
+        Get the invoicing wizard of current pickings
+        :param wizard_values: dict
+        :return: stock.invoice.onshipping record
+        """
+        return (
+            self.env["stock.invoice.onshipping"]
+            .with_company(fields.first(self).company_id)
+            .with_context(active_ids=self.ids, active_model=self._name)
+            .create(wizard_values)
+        )
+
+    def _create_invoices_group(self, wizard_values):
+        """
+        Invoice current pickings, a group of pickings of the wizard
+        :param wizard_values: dict
+        :return: account.move recordset
+        """
+        wizard = self._get_invoicing_wizard(wizard_values)
+        invoices = wizard._action_generate_invoices()
+        wizard._update_picking_invoice_status(invoices.mapped("picking_ids"))
+        return invoices
+
+    def create_invoices_job(self, wizard_values):
+        """
+        Invoice current pickings with the given options of the invoicing
+        wizard (executed in a job).
+        When the job invoices several groups of pickings, each group is
+        invoiced in its own savepoint: a group failing is rolled back and
+        enqueued in its own job, without affecting the others.
+        :param wizard_values: dict
+        :return: str
+        """
+        self = self.with_context(**{INVOICING_CACHE_KEY: InvoicingCache()})
+        pick_list = list(
+            self._get_invoicing_wizard(wizard_values)._group_pickings(self)
+        )
+        if len(pick_list) <= 1:
+            invoices = self._create_invoices_group(wizard_values)
+        else:
+            invoices = self.env["account.move"]
+            for pickings in pick_list:
+                self.flush()
+                try:
+                    with self.env.cr.savepoint():
+                        invoices |= pickings._create_invoices_group(wizard_values)
+                except Exception:
+                    _logger.exception(
+                        "Failed to invoice pickings %s, enqueued in a new job",
+                        pickings.ids,
+                    )
+                    self.invalidate_cache()
+                    pickings._enqueue_invoices_job(wizard_values)
+        return _("Invoices created: %s") % ", ".join(
+            str(invoice_id) for invoice_id in invoices.ids
+        )
+
+    def _enqueue_invoices_job(self, wizard_values):
+        """
+        Enqueue a job invoicing current pickings
+        :param wizard_values: dict
+        :return: queue.job recordset
+        """
+        delayed = self.with_delay(
+            description=_("Invoice pickings %s") % ", ".join(self.mapped("name"))
+        ).create_invoices_job(wizard_values)
+        job = self.env["queue.job"].sudo().search([("uuid", "=", delayed.uuid)])
+        self.sudo().write({"invoicing_job_ids": [(4, job.id)]})
+        return job
@@ -0,0 +1,160 @@
+# Copyright (C) 2019-Today: Odoo Community Association (OCA)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from unittest import mock
+
+from odoo import exceptions, tools
+from odoo.tests import SavepointCase, tagged
+
+
+@tagged("post_install", "-at_install")
+class TestPickingInvoicingQueued(SavepointCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.picking_model = cls.env["stock.picking"]
+        cls.invoice_wizard = cls.env["stock.invoice.onshipping"]
+        cls.queue_obj = cls.env["queue.job"]
+        cls.partner = cls.env["res.partner"].create({"name": "Test partner"})
+        cls.partner2 = cls.env["res.partner"].create({"name": "Other partner"})
+        cls.pick_type_out = cls.env.ref("stock.picking_type_out")
+        cls.stock_location = cls.env.ref("stock.stock_location_stock")
+        cls.customers_location = cls.env.ref("stock.stock_location_customers")
+        cls.product = cls.env["product.product"].create(
+            {"name": "Test product", "type": "consu", "lst_price": 20}
+        )
+        cls.picking = cls._create_picking(cls.partner)
+        cls.picking2 = cls._create_picking(cls.partner)
+        cls.picking3 = cls._create_picking(cls.partner2)
+        cls.pickings = cls.picking | cls.picking2 | cls.picking3
+
+    @classmethod
+    def _create_picking(cls, partner):
+        picking = cls.picking_model.create(
+            {
+                "partner_id": partner.id,
+                "picking_type_id": cls.pick_type_out.id,
+                "location_id": cls.stock_location.id,
+                "location_dest_id": cls.customers_location.id,
+                "move_lines": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": cls.product.name,
+                            "product_id": cls.product.id,
+                            "product_uom_qty": 1,
+                            "product_uom": cls.product.uom_id.id,
+                            "location_id": cls.stock_location.id,
+                            "location_dest_id": cls.customers_location.id,
+                        },
+                    )
+                ],
+            }
+        )
+        picking.set_to_be_invoiced()
+        picking.action_confirm()
+        picking.action_assign()
+        for move in picking.move_lines:
+            move.quantity_done = move.product_uom_qty
+        picking.button_validate()
+        return picking
+
+    def _get_wizard(self, **values):
+        wizard_obj = self.invoice_wizard.with_context(
+            active_ids=self.pickings.ids, active_model=self.pickings._name
+        )
+        wizard_values = wizard_obj.default_get(wizard_obj.fields_get().keys())
+        wizard_values.update(values, enqueue=True)
+        return wizard_obj.create(wizard_values)
+
+    def test_queue_invoicing_by_partner(self):
+        wizard = self._get_wizard(group="partner", job_size=2)
+        prev_jobs = self.queue_obj.search([])
+        action = wizard.action_generate()
+        jobs = self.queue_obj.search([]) - prev_jobs
+        self.assertEqual(action["res_id"], wizard.id)
+        # One job per partner, as the 2 groups don't fit in a job
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(wizard.job_ids, jobs)
+        self.assertEqual(wizard.job_progress, 0.0)
+        self.assertEqual(
+            self.picking.invoicing_job_ids, self.picking2.invoicing_job_ids
+        )
+        self.assertNotEqual(
+            self.picking.invoicing_job_ids, self.picking3.invoicing_job_ids
+        )
+        self.assertFalse(self.pickings.mapped("invoice_ids"))
+        # Try to enqueue invoicing again
+        with self.assertRaises(exceptions.UserError):
+            self._get_wizard(group="partner").action_generate()
+
+    def test_queue_invoicing_by_picking(self):
+        wizard = self._get_wizard(group="picking", job_size=2)
+        prev_jobs = self.queue_obj.search([])
+        wizard.action_generate()
+        jobs = self.queue_obj.search([]) - prev_jobs
+        # 3 pickings, 2 pickings per job
+        self.assertEqual(len(jobs), 2)
+        job_sizes = [
+            len(self.pickings.filtered(lambda p, job=job: job in p.invoicing_job_ids))
+            for job in jobs
+        ]
+        self.assertEqual(sorted(job_sizes), [1, 2])
+
+    def test_queue_invoicing_by_partner_packed(self):
+        wizard = self._get_wizard(group="partner", job_size=3)
+        prev_jobs = self.queue_obj.search([])
+        wizard.action_generate()
+        jobs = self.queue_obj.search([]) - prev_jobs
+        # The groups of both partners are packed in the same job
+        self.assertEqual(len(jobs), 1)
+        for picking in self.pickings:
+            self.assertEqual(picking.invoicing_job_ids, jobs)
+        jobs.unlink()
+        # A group bigger than the job size is not split
+        wizard = self._get_wizard(group="partner", job_size=1)
+        wizard.action_generate()
+        jobs = self.queue_obj.search([]) - prev_jobs
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(
+            self.picking.invoicing_job_ids, self.picking2.invoicing_job_ids
+        )
+
+    def test_invoicing_job_group_failure(self):
+        wizard = self._get_wizard(group="partner")
+        wizard_class = type(wizard)
+        generate = wizard_class._action_generate_invoices
+        failing_ids = self.picking3.ids
+
+        def _action_generate_invoices(wizard):
+            if wizard.env.context.get("active_ids") == failing_ids:
+                raise ValueError("Invoicing failure")
+            return generate(wizard)
+
+        prev_jobs = self.queue_obj.search([])
+        with mock.patch.object(
+            wizard_class,
+            "_action_generate_invoices",
+            autospec=True,
+            side_effect=_action_generate_invoices,
+        ), tools.mute_logger("odoo.addons.stock_picking_invoicing_queued"):
+            self.pickings.create_invoices_job(wizard._get_job_wizard_values())
+        # The other group is invoiced
+        self.assertEqual(self.picking.invoice_ids, self.picking2.invoice_ids)
+        self.assertEqual(self.picking.invoice_state, "invoiced")
+        # The failing group is rolled back and enqueued in its own job
+        self.assertFalse(self.picking3.invoice_ids)
+        self.assertEqual(self.picking3.invoice_state, "2binvoiced")
+        jobs = self.queue_obj.search([]) - prev_jobs
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(self.picking3.invoicing_job_ids, jobs)
+
+    def test_invoicing_job(self):
+        # Execute method directly for checking if invoicing is done
+        wizard = self._get_wizard(group="partner")
+        self.pickings.create_invoices_job(wizard._get_job_wizard_values())
+        invoices = self.pickings.mapped("invoice_ids")
+        self.assertEqual(len(invoices), 2)
+        for picking in self.pickings:
+            self.assertEqual(picking.invoice_state, "invoiced")
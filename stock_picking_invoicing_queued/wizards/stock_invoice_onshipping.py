@@ -0,0 +1,159 @@
+# Copyright (C) 2019-Today: Odoo Community Association (OCA)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+
+class StockInvoiceOnshipping(models.TransientModel):
+    _inherit = "stock.invoice.onshipping"
+
+    enqueue = fields.Boolean(
+        string="Enqueue Invoicing",
+        help="Invoice the pickings in background jobs. Each job invoices "
+        "whole groups of pickings and is committed (or retried) on its own.",
+    )
+    job_size = fields.Integer(
+        default=100,
+        help="Maximum number of pickings invoiced by a job. The pickings "
+        "of the same invoice are never split across jobs, so a job may "
+        "invoice more pickings when a single group is bigger.",
+    )
+    job_ids = fields.Many2many(
+        comodel_name="queue.job",
+        string="Invoicing Jobs",
+        readonly=True,
+    )
+    job_count = fields.Integer(compute="_compute_job_progress")
+    job_done_count = fields.Integer(compute="_compute_job_progress")
+    job_failed_count = fields.Integer(compute="_compute_job_progress")
+    job_progress = fields.Float(compute="_compute_job_progress")
+
+    @api.depends("job_ids.state")
+    def _compute_job_progress(self):
+        for wizard in self:
+            # Jobs are only readable by job managers
+            jobs = wizard.sudo().job_ids
+            states = jobs.mapped("state")
+            wizard.job_count = len(jobs)
+            wizard.job_done_count = states.count("done")
+            wizard.job_failed_count = states.count("failed")
+            wizard.job_progress = (
+                100.0 * wizard.job_done_count / len(jobs) if jobs else 0.0
+            )
+
+    def action_generate(self):
+        """
+        Inherit to enqueue the invoice generation
+        :return: dict
+        """
+        self.ensure_one()
+        if not self.enqueue:
+            return super().action_generate()
+        self._action_enqueue_invoices()
+        return self._action_show_jobs()
+
+    def action_refresh_jobs(self):
+        """
+        Refresh the progress of the jobs
+        :return: dict
+        """
+        return self._action_show_jobs()
+
+    def _action_show_jobs(self):
+        """
+        Reopen the wizard to show the progress of the jobs
+        :return: dict
+        """
+        self.ensure_one()
+        return {
+            "name": _("Invoicing Jobs"),
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
+        }
+
+    def _get_job_wizard_values(self):
+        """
+        Get the values of the wizard used by jobs to invoice their pickings
+        :return: dict
+        """
+        self.ensure_one()
+        return {
+            "journal_type": self.journal_type,
+            "group": self.group,
+            "invoice_date": fields.Date.to_string(self.invoice_date),
+            "sale_journal": self.sale_journal.id,
+            "purchase_journal": self.purchase_journal.id,
+            "batch_mode": self.batch_mode,
+            "max_lines_per_invoice": self.max_lines_per_invoice,
+            "split_by_fiscal_position": self.split_by_fiscal_position,
+        }
+
+    def _split_job_pickings(self, pick_list):
+        """
+        Split the groups of pickings into the pickings invoiced by each job:
+        whole groups are packed into jobs of up to job_size pickings. A group
+        of pickings is never split across jobs.
+        :param pick_list: list of stock.picking recordset
+        :return: list of stock.picking recordset
+        """
+        self.ensure_one()
+        picking_obj = self.env["stock.picking"]
+        chunks = []
+        chunk = []
+        size = 0
+        for pickings in pick_list:
+            if chunk and size + len(pickings) > self.job_size:
+                chunks.append(picking_obj.union(*chunk))
+                chunk = []
+                size = 0
+            chunk.append(pickings)
+            size += len(pickings)
+        if chunk:
+            chunks.append(picking_obj.union(*chunk))
+        return chunks
+
+    def _action_enqueue_invoices(self):
+        """
+        Enqueue jobs to generate invoices based on pickings
+        :return: queue.job recordset
+        """
+        self.ensure_one()
+        if self.job_size < 1:
+            raise UserError(_("The job size must be positive."))
+        pickings = self._load_pickings()
+        company = pickings.mapped("company_id")
+        if company and company != self.env.company:
+            raise UserError(_("All pickings are not related to your company!"))
+        enqueued_pickings = pickings.sudo().filtered(
+            lambda p: p.invoicing_job_ids.filtered(
+                lambda j: j.state in {"pending", "enqueued", "started"}
+            )
+        )
+        if enqueued_pickings:
+            raise UserError(
+                _(
+                    "There's already an enqueued job for invoicing the pickings "
+                    "%s. Please wait until it's finished or remove them "
+                    "from the selection."
+                )
+                % ", ".join(enqueued_pickings.mapped("name"))
+            )
+        wizard_values = self._get_job_wizard_values()
+        uuids = {}
+        for job_pickings in self._split_job_pickings(self._group_pickings(pickings)):
+            delayed = job_pickings.with_delay(
+                description=_("Invoice pickings %s")
+                % ", ".join(job_pickings.mapped("name"))
+            ).create_invoices_job(wizard_values)
+            uuids[delayed.uuid] = job_pickings
+        jobs = self.env["queue.job"].sudo().search([("uuid", "in", list(uuids))])
+        for job in jobs:
+            uuids[job.uuid].sudo().write({"invoicing_job_ids": [(4, job.id)]})
+        if not jobs:
+            raise UserError(_("No invoice created!"))
+        self.sudo().write({"job_ids": [(6, 0, jobs.ids)]})
+        return jobs